@@ -1,169 +1,277 @@
 import PySimpleGUI as sg
-from analyzer import *
+from SHT_Analyzer.data_tools import UNITS
+from SHT_Analyzer.analyzer import SHT_Analyzer
+from SHT_Analyzer.batch_tools import AnalysisCancelled, analyze_files
+from SHT_Analyzer.prefetch_tools import Prefetcher
+# matplotlib is only imported once something is plotted, so the window opens sooner
 import os.path
+import threading
+import traceback
 
-labels = ["PtCo1(K)","PtCo2(K)","H2-Press(Torr)", "VAC-PM","VAC-CC10 (Pa)"]
-unit_dict = {"PtCo1(K)":"Temperature [K]","PtCo2(K)":"Temperature [K]",\
-             "VAC-CC10 (Pa)":"Pressure [Pa]", "VAC-PM":"Pressure [mbar]",\
-             "H2-Press(Torr)" : "Pressure [Torr]"}
+labels = list(UNITS)
+unit_dict = UNITS
 
 measurement_menu_def = ["Select measurement", labels]
 minimum_window = "24 h"
+n_boot = 2000
+# Block bootstrap resamples per cold period when "Bootstrap errors" is ticked
 label = ""
+sa = None
+# Analyzer of the selected file, once it has been loaded
+trends_running = False
+cancel_trends = threading.Event()
+# Set by the Cancel button to stop a running trends job
 
-sg.LOOK_AND_FEEL_TABLE["CustomTheme"] = {'BACKGROUND': '#000000',\
-                                        'TEXT': '#ffffff',\
-                                        'INPUT': '#000000', 
-                                        'TEXT_INPUT': '#ffffff',\
-                                        'SCROLL': '#99CC99',\
-                                        'BUTTON': ('#ffffff', '#d62728'),\
-                                        'PROGRESS': ('#D1826B', '#CC8019'),\
-                                        'BORDER': 1, 'SLIDER_DEPTH': 0,  'PROGRESS_DEPTH': 0, }
-  
-sg.theme("CustomTheme") 
-
-# First the window layout in 2 columns
-
-file_list_column = [
-    [
-        sg.Text("Data Folder"),
-        sg.In(enable_events=True, key="-FOLDER-"),
-        sg.FolderBrowse(),
-    ],
-    [
-        sg.Listbox(
-            values=[], enable_events=True, size=(40, 20), key="-FILE LIST-"
-        )
-    ],
-]
-
-plot_viewer_column = [
-    [sg.Text("Choose a folder on the left and select a file")],\
-    [sg.Text("File selected: "), sg.Text(auto_size_text=True, key="-TOUT-")],\
-    [sg.Text("Start date of data: "), sg.Text(auto_size_text=True, key="-START DATE-")],\
-    [sg.Text("End date of data: "), sg.Text(auto_size_text=True, key="-END DATE-")],\
-
-
-    [sg.ButtonMenu(button_text = "Select measurement", menu_def = measurement_menu_def,\
-                   auto_size_button = True, key = "-SELECT MEASUREMENT-")],\
-    [sg.Text("Units: "), sg.Text(key = "-MEASOUT-")],\
-    [sg.Text("Measurement: "), sg.Text(key = "-UNITOUT-")],\
-    [sg.Checkbox("Show entire time range", key = "-FULL PLOT-")],
-    [sg.Text("Minimum measurement window: "),\
-     sg.In(minimum_window, enable_events=True, size=20, key = "-MINOUT-")],\
-    [sg.Button("Show plot", auto_size_button = True, disabled = True, key = "-SHOW PLOT-"),\
-     sg.Checkbox("Include fit", key = "-INCLUDE FIT-")],\
-    [sg.Button("Generate warming rate trends", auto_size_button = True, disabled = True,\
-               key = "-TRENDS PLOT-")],\
-]
-
-layout = [
-    [
-        sg.Column(file_list_column, expand_x = True, expand_y = True),
-        sg.VSeperator(),
-        sg.Column(plot_viewer_column, expand_x = True, expand_y = True),
-        
-    ]
-]
-
-window = sg.Window("SHT Measurement Viewer", layout, resizable = True)
-fnames = []
-
-while True:
-        
-    event, values = window.read()
-    
-    if event == "Exit" or event == sg.WIN_CLOSED:
-        window.close()
-        break
-        
-    if event == "-FOLDER-":
-        folder = values["-FOLDER-"]
+
+def run_in_background(window, key, func, *args, **kwargs):
+    # Runs func on a worker thread so the window stays responsive. Its return value is
+    # posted to the window as event 'key'; a failure posts "-ERROR-" with the traceback
+    # and a cancelled trends job posts "-CANCELLED-"
+    def work():
         try:
-            # Get list of files in folder
-            file_list = os.listdir(folder)
-        except:
-            file_list = []
-    
-        fnames = [f
-            for f in file_list
-            if os.path.isfile(os.path.join(folder, f))
-            and f.lower().endswith((".csv"))
+            result = func(*args, **kwargs)
+        except AnalysisCancelled:
+            window.write_event_value("-CANCELLED-", key)
+        except Exception:
+            window.write_event_value("-ERROR-", (key, traceback.format_exc()))
+        else:
+            window.write_event_value(key, result)
+    threading.Thread(target = work, daemon = True).start()
+
+def load_file(filename, prefetch = False):
+    # Worker for "-FILE LIST-": reads and bins the file (or takes it from the prefetcher),
+    # tagged with its name
+    return filename, prefetcher.get(filename) if prefetch else SHT_Analyzer(filename)
+
+def load_column(analyzer, col):
+    # Worker for "-SHOW PLOT-": reads column 'col' into a copy of 'analyzer', which may be
+    # the prefetcher's (whose analyzers are never changed), tagged with the original
+    loaded = analyzer.copy()
+    loaded.load_columns([col])
+    return analyzer, loaded
+
+if __name__ == "__main__":
+# Worker processes of the analysis import this module too; only the GUI itself opens a window
+
+    prefetcher = Prefetcher()
+    # Loads the files of the folder in the background while "Prefetch files" is ticked
+
+    sg.LOOK_AND_FEEL_TABLE["CustomTheme"] = {'BACKGROUND': '#000000',\
+                                            'TEXT': '#ffffff',\
+                                            'INPUT': '#000000', 
+                                            'TEXT_INPUT': '#ffffff',\
+                                            'SCROLL': '#99CC99',\
+                                            'BUTTON': ('#ffffff', '#d62728'),\
+                                            'PROGRESS': ('#D1826B', '#CC8019'),\
+                                            'BORDER': 1, 'SLIDER_DEPTH': 0,  'PROGRESS_DEPTH': 0, }
+
+    sg.theme("CustomTheme") 
+
+    # First the window layout in 2 columns
+
+    file_list_column = [
+        [
+            sg.Text("Data Folder"),
+            sg.In(enable_events=True, key="-FOLDER-"),
+            sg.FolderBrowse(),
+        ],
+        [sg.Checkbox("Prefetch files", default = True, enable_events = True, key = "-PREFETCH-")],
+        [
+            sg.Listbox(
+                values=[], enable_events=True, size=(40, 20), key="-FILE LIST-"
+            )
+        ],
+    ]
+
+    plot_viewer_column = [
+        [sg.Text("Choose a folder on the left and select a file")],\
+        [sg.Text("File selected: "), sg.Text(auto_size_text=True, key="-TOUT-")],\
+        [sg.Text("Start date of data: "), sg.Text(auto_size_text=True, key="-START DATE-")],\
+        [sg.Text("End date of data: "), sg.Text(auto_size_text=True, key="-END DATE-")],\
+
+
+        [sg.ButtonMenu(button_text = "Select measurement", menu_def = measurement_menu_def,\
+                       auto_size_button = True, key = "-SELECT MEASUREMENT-")],\
+        [sg.Text("Units: "), sg.Text(key = "-MEASOUT-")],\
+        [sg.Text("Measurement: "), sg.Text(key = "-UNITOUT-")],\
+        [sg.Checkbox("Show entire time range", key = "-FULL PLOT-")],
+        [sg.Text("Minimum measurement window: "),\
+         sg.In(minimum_window, enable_events=True, size=20, key = "-MINOUT-")],\
+        [sg.Button("Show plot", auto_size_button = True, disabled = True, key = "-SHOW PLOT-"),\
+         sg.Checkbox("Include fit", key = "-INCLUDE FIT-")],\
+        [sg.Button("Generate warming rate trends", auto_size_button = True, disabled = True,\
+                   key = "-TRENDS PLOT-"),\
+         sg.Checkbox("Bootstrap errors", key = "-BOOTSTRAP-"),\
+         sg.Checkbox("Split regimes", key = "-SEGMENT-")],\
+        [sg.ProgressBar(1, orientation = "h", size = (30, 20), key = "-PROGRESS-"),\
+         sg.Button("Cancel", disabled = True, key = "-CANCEL-")],\
+        [sg.Text("", size = (50, 1), key = "-STATUS-")],\
+    ]
+
+    layout = [
+        [
+            sg.Column(file_list_column, expand_x = True, expand_y = True),
+            sg.VSeperator(),
+            sg.Column(plot_viewer_column, expand_x = True, expand_y = True),
+
         ]
-        window["-FILE LIST-"].update(fnames)
+    ]
 
-        if label != "":
-            window["-SHOW PLOT-"].update(disabled = False)
-            window["-TRENDS PLOT-"].update(disabled = False)
-        
-    elif event == "-FILE LIST-":  # A file was chosen from the listbox
-        try:
+    window = sg.Window("SHT Measurement Viewer", layout, resizable = True)
+    fnames = []
+
+    while True:
+
+        event, values = window.read()
+
+        if event == "Exit" or event == sg.WIN_CLOSED:
+            prefetcher.close()
+            window.close()
+            break
+
+        if event == "-FOLDER-":
+            folder = values["-FOLDER-"]
+            try:
+                # Get list of files in folder
+                file_list = os.listdir(folder)
+            except OSError:
+                file_list = []
+
+            fnames = [f
+                for f in file_list
+                if os.path.isfile(os.path.join(folder, f))
+                and f.lower().endswith((".csv"))
+            ]
+            window["-FILE LIST-"].update(fnames)
+            prefetcher.clear()
+            if values["-PREFETCH-"]:
+                prefetcher.prefetch([os.path.join(folder, f) for f in fnames])
+                # Newest files first, the ones most likely to be looked at
+
+            if label != "":
+                window["-SHOW PLOT-"].update(disabled = sa is None)
+                window["-TRENDS PLOT-"].update(disabled = trends_running)
+
+        elif event == "-FILE LIST-" and values["-FILE LIST-"]:  # A file was chosen from the listbox
             filename = os.path.join(
                 values["-FOLDER-"], values["-FILE LIST-"][0]
             )
             window["-TOUT-"].update(values["-FILE LIST-"][0])
-            
-            sa = SHT_Analyzer(filename)
-            window["-START DATE-"].update(sa.abs_start)
-            window["-END DATE-"].update(sa.abs_end)
-
-        except:
-            pass
-            
-    if event == "-SELECT MEASUREMENT-":
-        try:
-            
+            window["-STATUS-"].update("Loading " + values["-FILE LIST-"][0])
+            window["-SHOW PLOT-"].update(disabled = True)
+            sa = None
+            if values["-PREFETCH-"]:
+                prefetcher.promote(filename)
+            run_in_background(window, "-FILE LOADED-", load_file, filename, values["-PREFETCH-"])
+
+        if event == "-FILE LOADED-":
+            loaded_name, loaded = values["-FILE LOADED-"]
+            if loaded_name == filename:
+                # Ignores files that were replaced by another selection while loading
+                sa = loaded
+                window["-START DATE-"].update(sa.abs_start)
+                window["-END DATE-"].update(sa.abs_end)
+                window["-STATUS-"].update("")
+                if label != "":
+                    window["-SHOW PLOT-"].update(disabled = False)
+
+        if event == "-SELECT MEASUREMENT-" and values["-SELECT MEASUREMENT-"] in unit_dict:
             label = str(values["-SELECT MEASUREMENT-"])
             unit_selected = unit_dict[label]
             window["-MEASOUT-"].update(label)
             window["-UNITOUT-"].update(unit_selected)
-            
+            prefetcher.want([label])
+            # Prefetched files get the measurement too, ready for a plot or a trends run
+
             if fnames != []:
-                window["-SHOW PLOT-"].update(disabled = False)
-                window["-TRENDS PLOT-"].update(disabled = False)
-        except:
-            pass
-    if event == "-MINOUT-":
-        try:
+                window["-SHOW PLOT-"].update(disabled = sa is None)
+                window["-TRENDS PLOT-"].update(disabled = trends_running)
+
+        if event == "-PREFETCH-":
+            if values["-PREFETCH-"] and fnames:
+                prefetcher.prefetch([os.path.join(folder, f) for f in fnames])
+            elif not values["-PREFETCH-"]:
+                prefetcher.clear()
+
+        if event == "-MINOUT-":
             minimum_window = values["-MINOUT-"]
-        except:
-            pass
-
-    if event == "-SHOW PLOT-":
-        # try:
-        if window["-FULL PLOT-"].get():
-            sa.process_data(label, unit_selected, min_duration = minimum_window, \
-                        with_fit = window["-INCLUDE FIT-"].get(), between = (sa.abs_start, sa.abs_end))
-        else:
-            sa.process_data(label, unit_selected, min_duration = minimum_window,\
-                        with_fit = window["-INCLUDE FIT-"].get())
-        # except:
-        #     pass 
-    if event == "-TRENDS PLOT-":
-        try:
-            dates = []
-            datetimes = []
-            slopes = []
-            errs = []
-            
-            for i, filepath in enumerate(fnames):
-                sg.one_line_progress_meter("", i, len(fnames), orientation = "h")
-                if filepath.endswith(".csv"):
-                    sa = SHT_Analyzer(os.path.join(folder, filepath))
+
+        if event == "-SHOW PLOT-":
+            window["-SHOW PLOT-"].update(disabled = True)
+            window["-STATUS-"].update("Loading " + label)
+            run_in_background(window, "-COLUMN LOADED-", load_column, sa, label)
+            # Reads the column off the GUI thread; matplotlib then plots on this one
+
+        if event == "-COLUMN LOADED-" and values["-COLUMN LOADED-"][0] is not sa:
+            window["-SHOW PLOT-"].update(disabled = sa is None)
+            # Loaded for a file that is no longer selected: nothing to plot
+
+        elif event == "-COLUMN LOADED-":
+            sa = values["-COLUMN LOADED-"][1]
+            window["-SHOW PLOT-"].update(disabled = False)
+            window["-STATUS-"].update("")
+            try:
+                if window["-FULL PLOT-"].get():
+                    sa.process_data(label, unit_selected, min_duration = minimum_window, \
+                                with_fit = window["-INCLUDE FIT-"].get(), between = (sa.abs_start, sa.abs_end),\
+                                segment = window["-SEGMENT-"].get())
+                else:
                     sa.process_data(label, unit_selected, min_duration = minimum_window,\
-                            with_fit = False, show_plot = False)
-    
-                    dates.append(sa.dates)
-                    datetimes.append([dt.strptime(date, "%d %B %Y") for date in sa.dates])
-                    slopes.append(sa.slopes)
-                    errs.append(sa.slope_errs)
-                    
-            dates = list(chain(*dates))
-            datetimes = list(chain(*datetimes))
-            slopes = np.array(list(chain(*slopes)))
-            errs = np.array(list(chain(*errs)))
-            show_warming_trends(datetimes, slopes, errs, dates, label)
+                                with_fit = window["-INCLUDE FIT-"].get(), segment = window["-SEGMENT-"].get())
+            except Exception as e:
+                sg.popup_error("Could not plot %s: %s" % (label, e))
+
+        if event == "-TRENDS PLOT-":
+            cancel_trends.clear()
+            trends_running = True
+            trends_label = label
+            # The measurement can be changed while the job runs
+            window["-TRENDS PLOT-"].update(disabled = True)
+            window["-CANCEL-"].update(disabled = False)
+            window["-PROGRESS-"].update(0, max = len(fnames))
+            window["-STATUS-"].update("Analyzing %d files" % len(fnames))
+            run_in_background(window, "-TRENDS DONE-", analyze_files,\
+                              [os.path.join(folder, f) for f in fnames], label, unit_selected,\
+                              min_duration = minimum_window, cancel = cancel_trends,\
+                              n_boot = n_boot if window["-BOOTSTRAP-"].get() else 0,\
+                              segment = window["-SEGMENT-"].get(),\
+                              prefetcher = prefetcher if window["-PREFETCH-"].get() else None,\
+                              progress = lambda i, n: window.write_event_value("-TRENDS PROGRESS-", (i, n)))
+            # Analyzes every file on a pool of worker processes, off the GUI thread; files
+            # already prefetched are fitted without reading them again
+
+        if event == "-TRENDS PROGRESS-":
+            n_done, n_total = values["-TRENDS PROGRESS-"]
+            window["-PROGRESS-"].update(n_done, max = n_total)
+            window["-STATUS-"].update("Analyzed %d of %d files" % (n_done, n_total))
+
+        if event == "-CANCEL-":
+            cancel_trends.set()
+            window["-CANCEL-"].update(disabled = True)
+            window["-STATUS-"].update("Cancelling")
+
+        if event == "-TRENDS DONE-":
+            trends_running = False
+            window["-TRENDS PLOT-"].update(disabled = False)
+            window["-CANCEL-"].update(disabled = True)
+            window["-STATUS-"].update("")
+            import matplotlib.pyplot as plt
+            from SHT_Analyzer.graphing_tools import show_warming_trends
+            show_warming_trends(values["-TRENDS DONE-"], trends_label)
             plt.show()
-        except:
-            pass
-    
\ No newline at end of file
+
+        if event == "-CANCELLED-":
+            trends_running = False
+            window["-TRENDS PLOT-"].update(disabled = False)
+            window["-STATUS-"].update("Cancelled")
+
+        if event == "-ERROR-":
+            failed, trace = values["-ERROR-"]
+            if failed == "-TRENDS DONE-":
+                trends_running = False
+                window["-TRENDS PLOT-"].update(disabled = False)
+                window["-CANCEL-"].update(disabled = True)
+            elif failed == "-COLUMN LOADED-":
+                window["-SHOW PLOT-"].update(disabled = sa is None)
+            window["-STATUS-"].update("")
+            sg.popup_error("The analysis failed:", trace)
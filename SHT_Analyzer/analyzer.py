@@ -1,39 +1,355 @@
-from graphing_tools import *
-from format_tools import *
-from fit_tools import *
-from scipy.optimize import curve_fit
-from itertools import chain
+from .format_tools import *
+from .fit_tools import *
+from .cache_tools import *
+from .live_tools import *
+from .data_tools import *
+from .stats_tools import *
+from .pyramid_tools import *
+from .archive_tools import Archive, is_archive
+import copy
+from collections import OrderedDict
 
 
 class SHT_Analyzer:
 # Catchall analyzer class: stores resampled data, 
 # fit parameters, error, plotting functions 
 
-    def __init__(self, filepath):
-        self.raw_data = pd.read_csv(filepath)
-        self.all_data = bin_by_minute(standardize_datetime(filepath), n_minutes = 10)
-        # Bins data into 1min intervals
-        self.dt_data = self.all_data["date-time"]
-        
-        self.abs_start = self.dt_data.iloc[0]
-        self.abs_end = self.dt_data.iloc[-1]
-        
-        self.mask = mask_between(self.dt_data, self.abs_start,\
-                                 self.abs_end)
-        # Include entire range of times by default
-        self.cold_ranges = find_cold_ranges(self.all_data)
-        # Get ranges of time where experiment is cold
+    def __init__(self, filepath, columns = None, use_cache = True, cache_dir = None, live = False,\
+                 chunksize = None, dtype = np.float64, stats = None, n_minutes = 10,\
+                 window = (None, None), cold_conditions = None):
+        self.filepath = filepath
+        self.archive = Archive(filepath) if is_archive(filepath) else None
+        # 'filepath' may also be an archive of many logs (see build_archive)
+        self.window = window
+        # (start, end) of the span of an archive to analyze, None for its first / last row
+        self.stats = make_stats(stats)
+        # Per-stage timing and memory records; pass True or a StageStats to turn them on
+        self.dtype = np.dtype(dtype)
+        # Storage type of the binned sensor columns; float32 halves their memory
+        self.chunksize = chunksize
+        # Rows read at a time, for logs too large to load at once (None reads the whole file)
+        self.fallback_rows = 0
+        # Rows read so far whose timestamp wasn't in the logger's format (see decode_timestamps)
+        self.pyramid = None
+        # AggregatePyramid of the raw data, built by build_pyramid for rebin and envelope
+        self._raw_data = None
+        self.use_cache = use_cache and not live and self.archive is None
+        # Archives are read without parsing, there is nothing to cache
+        self.cache_dir = cache_dir
+        self.live = None
+
+        self.n_minutes = n_minutes
+        # Width of the bins in minutes
+        self.cold_conditions = dict(COLD_CONDITIONS if cold_conditions is None else cold_conditions)
+        # (enter, exit) thresholds per sensor of the cold state, see ColdDetector
+        self.min_dwell = MIN_DWELL
+        # Shortest cold period or warm gap; shorter ones are random spikes
+        self.valid_ranges = dict(VALID_RANGES)
+        # Range of values each sensor can physically read, see valid_mask
+        self.hampel_window = 6
+        self.hampel_sigmas = 3.
+        # Bins on each side of the rolling median and width of the band kept around it
+        self.resolutions = dict(RESOLUTIONS)
+        # Step each sensor is logged in, the smallest deviation the Hampel filter can cut
+        self.masked = {}
+        # Column -> mask_params its validity mask was computed with
+        self.ranges_params = self.cold_params()
+        # cold_params the cold ranges were found with
+
+        with self.stage("cache_lookup"):
+            cached = load_cached(filepath, self.cache_params(), cache_dir) if self.use_cache else None
+        # Reuses the binned data and cold ranges of an unchanged file
+
+        if live:
+            self.live = LiveBinner(filepath, None if columns is None else list(self.cold_conditions) + list(columns),\
+                                   self.n_minutes)
+            # Follows every column unless told otherwise, since history can't be reread cheaply
+            self.cold_detector = ColdDetector(self.cold_conditions, self.min_dwell)
+            self.update()
+        elif cached is None:
+            usecols = list(dict.fromkeys(["date-time"] + list(self.cold_conditions) + list(columns or [])))
+            # Only the columns needed for cold ranges and the requested analyses are read;
+            # any other column is loaded on demand by load_columns
+            self.set_binned(BinnedData.from_frame(self.read_binned(usecols), self.dtype))
+            # Bins data into 10min intervals
+            self.despike(self.binned.names())
+            self.detect_cold()
+            # Get ranges of time where experiment is cold
+        else:
+            binned, self.cold_ranges = cached
+            self.set_binned(binned)
+            self.masked = {col: self.mask_params(col) for col in binned.valid}
+            # Cached with the current parameters, see cache_params
+            self.load_columns(columns or [])
+
+        self.fits = np.zeros(0, dtype = FIT_DTYPE)
+        # Results of the last call to process_data
+
         self.uncert = 1
         # Default uncertainty
-        self.zscore = 2
-        # Within how many standard deviations to fit data
-        
-    def process_data(self, col, data_label, between = (None, None), show_plot = True,\
-                     with_fit = True, min_duration = "12h"):
+        self.max_results = 16
+        # Results of process_data kept in self.results for reuse, least recently used dropped first
+        self.plots_per_page = 4
+        # Fits drawn per figure by process_data, in a 2 column grid
+        self.max_points = 2000
+        # Points drawn per plot (see minmax_decimate), None to draw every bin
+        self.segment_penalty = 3.
+        self.min_segment = pd.Timedelta(hours = 6)
+        # Penalty per segment and shortest segment of segment_windows (see linear_changepoints)
+        self.n_boot = 0
+        # Block bootstrap resamples per window for the slope intervals, 0 to skip them
+        self.confidence = 0.95
+        # Probability covered by the bootstrap intervals
+        self.boot_workers = 1
+        # Worker processes the bootstrap spreads windows over (None for every core);
+        # batch runs already spread files over processes
 
-        min_duration = timedelta_from_duration(min_duration)
-        # Sets the shortest window of time to be analyzed
-        
+    @property
+    def raw_data(self):
+        # The unbinned csv, only read when asked for so cached loads never touch it
+        if self._raw_data is None:
+            self._raw_data = pd.read_csv(self.filepath) if self.archive is None\
+                             else self.archive.read(None, *self.window)
+        return self._raw_data
+
+    @property
+    def all_data(self):
+        # The binned data as a DataFrame, wrapping the arrays of self.binned without copies
+        return self.binned.to_frame()
+
+    @property
+    def dt_data(self):
+        return pd.Series(self.binned.times.view("datetime64[ns]"), name = "date-time", copy = False)
+
+    dates = property(lambda self: fit_dates(self.fits))
+    slopes = fit_field("slope")
+    intercepts = fit_field("intercept")
+    slope_errs = fit_field("slope_err")
+    slope_intervals = property(lambda self: np.stack((self.fits["slope_lo"], self.fits["slope_hi"]), axis = 1))
+    intercept_errs = fit_field("intercept_err")
+    chi_sq = fit_field("chi_sq")
+    DOF = fit_field("DOF")
+    # Fit results under the names of the lists process_data used to fill
+
+    def cache_params(self):
+        # Analysis parameters that the cached binned data and cold ranges depend on
+        return {"n_minutes": self.n_minutes, "cold_conditions": self.cold_conditions,\
+                "min_dwell": str(self.min_dwell),\
+                "dtype": self.dtype.str, "valid_ranges": self.valid_ranges,\
+                "hampel": [self.hampel_window, self.hampel_sigmas], "resolutions": self.resolutions}
+
+    def store_cache(self):
+        # Saves the binned data and cold ranges for the next time this file is opened
+        if self.use_cache:
+            with self.stage("cache_store", len(self.binned)):
+                store_cached(self.filepath, self.cache_params(), self.binned,\
+                             self.cold_ranges, self.cache_dir)
+
+    def copy(self):
+        # Shallow copy for use on another thread: the arrays of the binned data are shared
+        # (they are only ever replaced, never written to), everything loading columns,
+        # despiking or fitting changes is its own
+        clone = copy.copy(self)
+        clone.binned = BinnedData(self.binned.times, dict(self.binned.columns), dict(self.binned.valid))
+        clone.masked = dict(self.masked)
+        clone.results = self.results.copy()
+        return clone
+
+    def set_binned(self, binned):
+        # Sets the binned data (a BinnedData) and the time span it covers.
+        # Results memoized for the previous data no longer apply
+        self.binned = binned
+        self.results = OrderedDict()
+        if len(binned):
+            self.abs_start = pd.Timestamp(binned.times[0])
+            self.abs_end = pd.Timestamp(binned.times[-1])
+
+    def stage(self, name, rows = None):
+        # Context manager recording stage 'name' of the analysis of this file in self.stats
+        return self.stats.stage(name, rows, source = self.filepath)
+
+    def read_binned(self, usecols):
+        # Reads the columns 'usecols' of the log (or the window of the archive) and bins them,
+        # chunk by chunk if chunksize is set
+        if self.chunksize is None:
+            with self.stage("parse") as record:
+                df = standardize_datetime(self.filepath, usecols) if self.archive is None\
+                     else self.archive.read(usecols, *self.window)
+                record["rows"] = len(df)
+                self.fallback_rows += df.attrs.get("fallback_rows", 0)
+            with self.stage("bin", len(df)):
+                return bin_by_minute(df, n_minutes = self.n_minutes)
+
+        with self.stage("parse_bin") as record:
+            chunks = standardize_datetime_chunks(self.filepath, usecols, self.chunksize) if self.archive is None\
+                     else self.archive.chunks(usecols, *self.window, self.chunksize)
+            binned = bin_chunks_by_minute(self.count_fallbacks(chunks), n_minutes = self.n_minutes)
+            record["rows"] = len(binned)
+            # Chunks are parsed and binned in turn; only the number of bins is known
+        return binned
+
+    def count_fallbacks(self, chunks):
+        # Passes chunks of standardize_datetime_chunks through, adding up their fallback rows
+        for df in chunks:
+            self.fallback_rows += df.attrs.get("fallback_rows", 0)
+            yield df
+
+    def mask_params(self, col):
+        # Parameters the validity mask of 'col' is computed with
+        return (self.valid_ranges.get(col, (-np.inf, np.inf)), self.hampel_window, self.hampel_sigmas,\
+                self.resolutions.get(col, 0.))
+
+    def cold_params(self):
+        # Parameters the cold ranges are found with
+        return (tuple(self.cold_conditions.items()), self.min_dwell)
+
+    def despike(self, columns):
+        # Computes the validity mask (see valid_mask) of each of 'columns' that doesn't have one,
+        # or has one computed with other parameters, and drops earlier results if it did.
+        # Runs once per column when it is loaded; fits only index into the masks.
+        # Returns True if any mask was computed
+        columns = [col for col in columns if col not in self.binned.valid\
+                   or self.masked.get(col) != self.mask_params(col)]
+        if not columns:
+            return False
+        with self.stage("despike", len(self.binned) * len(columns)):
+            for col in columns:
+                self.binned.valid[col] = valid_mask(self.binned.columns[col], *self.mask_params(col))
+                self.masked[col] = self.mask_params(col)
+        self.results = OrderedDict()
+        return True
+
+    def refresh(self, columns):
+        # Loads 'columns' and brings their validity masks and the cold ranges up to date, e.g.
+        # after a live update or a change of valid_ranges, the Hampel filter or cold_conditions
+        self.load_columns(columns)
+        if self.ranges_params != self.cold_params():
+            self.despike(columns)
+            self.detect_cold()
+        elif self.despike(columns):
+            self.store_cache()
+
+    def load_columns(self, columns):
+        # Reads, bins and adds the columns of 'columns' that aren't loaded yet
+        missing = [col for col in columns if col not in self.binned]
+        if not missing:
+            return
+        if self.live is not None:
+            raise ValueError("%s not followed in live mode" % ", ".join(missing))
+
+        new_data = BinnedData.from_frame(self.read_binned(missing), self.dtype)
+        self.set_binned(self.binned.merge(new_data))
+        self.despike(missing)
+        # Only keeps bins where every loaded column has data, like bin_by_minute does
+        self.store_cache()
+
+    def update(self):
+        """
+        Live mode: ingests the rows the logger appended since the last update.
+
+        Only the new rows are parsed. They are folded into the open bin, finished bins
+        extend or close the current cold range, and all_data is refreshed as views of
+        the live buffers, so the cost doesn't grow with the length of the log.
+
+        Returns:
+            The number of new rows
+        """
+
+        with self.stage("live_update") as record:
+            n_seen = self.live.n_bins
+            resets = self.live.resets
+            n_rows = self.live.poll()
+            if self.live.resets != resets:
+                self.cold_detector = ColdDetector(self.cold_conditions, self.min_dwell)
+                n_seen = 0
+                # The log was truncated or replaced and has been read again from the top
+
+            times, values = self.live.closed(n_seen)
+            self.cold_detector.update(times, {col: values[self.live.columns.index(col)]\
+                                              for col in self.cold_detector.columns()})
+            self.cold_ranges = self.cold_detector.intervals()
+
+            self.set_binned(self.live.view())
+            record["rows"] = n_rows
+
+        return n_rows
+
+    def detect_cold(self):
+        # Finds the cold ranges of the binned data with self.cold_conditions and self.min_dwell,
+        # e.g. after changing them, and caches them. Earlier results, fitted over the old
+        # ranges, are dropped
+        self.load_columns(self.cold_conditions)
+        with self.stage("cold_ranges", len(self.binned)):
+            detector = ColdDetector(self.cold_conditions, self.min_dwell)
+            if self.live is None:
+                detector.update(self.binned.times, self.binned.columns)
+            else:
+                times, values = self.live.closed(0)
+                detector.update(times, {col: values[self.live.columns.index(col)] for col in detector.columns()})
+                self.cold_detector = detector
+                # Live updates carry on from the finished bins, like update does
+            self.cold_ranges = detector.intervals()
+        self.ranges_params = self.cold_params()
+        self.results = OrderedDict()
+        self.store_cache()
+
+    def build_pyramid(self, columns):
+        # Aggregates the raw rows of 'columns' (and PtCo1) at every level of LEVELS, once:
+        # the pyramid is cached like the binned data, so later calls don't read the log
+        if self.live is not None:
+            raise ValueError("No aggregate pyramid in live mode")
+        columns = list(dict.fromkeys(["PtCo1(K)"] + list(columns)))
+        params = {"pyramid": list(LEVELS), "columns": sorted(columns)}
+
+        with self.stage("pyramid") as record:
+            pyramid = load_cached_pyramid(self.filepath, params, self.cache_dir) if self.use_cache else None
+            if pyramid is None:
+                chunks = standardize_datetime_chunks(self.filepath, ["date-time"] + columns, self.chunksize or 10**6)\
+                         if self.archive is None else self.archive.chunks(columns, *self.window, self.chunksize or 10**6)
+                pyramid = AggregatePyramid.from_chunks(self.count_fallbacks(chunks), columns)
+                if self.use_cache:
+                    store_cached_pyramid(self.filepath, params, pyramid, self.cache_dir)
+            record["rows"] = len(pyramid.times[0])
+        self.pyramid = pyramid
+
+    def rebin(self, n_minutes):
+        """
+        Changes the width of the bins without reading the log again.
+
+        The bins are served from the aggregate pyramid (built on the first call), so going
+        back and forth between e.g. 10 min and 1 h bins costs a pass over the coarsest
+        level that fits rather than a parse of the raw data. The loaded columns are
+        despiked again, the cold ranges are found again and earlier results are dropped.
+
+        Args:
+            n_minutes: The new width of the bins in minutes
+
+        Returns:
+            None
+
+        """
+
+        columns = self.binned.names()
+        if self.pyramid is None or any(col not in self.pyramid for col in columns):
+            self.build_pyramid(columns)
+
+        with self.stage("rebin") as record:
+            self.n_minutes = n_minutes
+            self.set_binned(self.pyramid.binned(n_minutes, columns, dtype = self.dtype))
+            record["rows"] = len(self.binned)
+        self.despike(self.binned.names())
+        self.detect_cold()
+
+    def envelope(self, col, n_minutes = None, between = (None, None)):
+        # Mean, std, min and max of 'col' in bins of n_minutes (default: the current bins)
+        # between the datetimes of 'between', from the aggregate pyramid (see AggregatePyramid.envelope)
+        if self.pyramid is None or col not in self.pyramid:
+            self.build_pyramid(self.binned.names() + [col])
+        return self.pyramid.envelope(col, n_minutes or self.n_minutes, *between)
+
+    def set_span(self, between):
+        # Sets self.start_time and self.end_time, the span analyzed, and returns the
+        # (start, end) ranges in it to fit: the cold ranges, or 'between' itself
         start_time, end_time = between
         if between == (None, None):
             # No specific window of time desired; analyze all
@@ -45,57 +361,306 @@ class SHT_Analyzer:
             ranges = [between]
             self.start_time = dt.strptime(start_time, "%Y/%m/%d %H:%M:%S") if type(start_time) == str else start_time 
             self.end_time = dt.strptime(end_time, "%Y/%m/%d %H:%M:%S") if type(end_time) == str else end_time
-        
-        self.dates, self.masks, self.slopes, self.intercepts,\
-        self.slope_errs, self.intercept_errs, self.chi_sq, self.DOF = [],[],[],[],[],[],[],[]
-        # Lists to store data; not sure if this could be optimized
+        return ranges
+
+    def fit_windows(self, between, min_duration):
+        """
+        The windows of time to fit, shared by process_data and process_data_multi.
+
+        Args:
+            between: (start, end) of the one window to fit, or (None, None) for every
+                     cold period. Strings are read as "%Y/%m/%d %H:%M:%S".
+            min_duration: Timedelta, shortest window to fit
 
-        
-        for start_time, end_time in ranges:
+        Returns:
+            A list of (start_time, end_time, window): each window, truncated to avoid
+            edge values, and the slice of the binned data it covers
+
+        """
+
+        windows = []
+        for start_time, end_time in self.set_span(between):
 
             start_time = pd.Timestamp(start_time) + timedelta(hours = 1)
             end_time = pd.Timestamp(end_time) - timedelta(seconds = 600)
             # Truncate 1 hour from start and 10 mins from end to avoid edge values
-            
-            
-            # print(start_time, end_time)
 
-            
             if pd.Timedelta(end_time - start_time).total_seconds() > min_duration.total_seconds():
-                mask = mask_between(self.dt_data, start_time, end_time)
-                # Selects window specified by [start_time, end_time]
-                
-                self.data = self.all_data[col]
-                # Sets specific Series of interest
-
-                self.data, mask, self.uncert = \
-                apply_mask(start_time, end_time, min_duration, mask,self.dt_data,\
-                           self.data, col, data_label, self.zscore, self.uncert)
+                window = slice_between(self.binned.times, start_time, end_time)
+                # Selects window specified by [start_time, end_time] by binary search
+                if window.start == window.stop:
+                    window = slice(0, len(self.binned))
+                # Handles cases where dates provided to 'between' parameter
+                # are out of bounds; defaults to full time range
+                windows.append((start_time, end_time, window))
+
+        return windows
+
+    def result_key(self, col, between, min_duration):
+        # Everything the fits of process_data depend on, apart from the data itself
+        between = tuple(None if t is None else pd.Timestamp(t) for t in between)
+        return (col, between, min_duration, self.uncert, self.n_minutes, self.n_boot, self.confidence)
+        # Changes to the validity masks or cold ranges drop the results instead (see refresh)
+
+    def fit_column(self, col, between, min_duration):
+        """
+        Fits every window of one column, the work memoized by process_data.
+
+        Args:
+            col: String, column label in the output of the SHT logger
+            between: (start, end) of the one window to fit, or (None, None) for every
+                     cold period
+            min_duration: Timedelta, shortest window to fit
+
+        Returns:
+            (fits, windows): the FIT_DTYPE records of each window and the
+            (start_time, end_time, window, index, data, t_data) show_fits draws it from
+
+        """
+
+        times = self.binned.times
+        valid = self.binned.valid[col]
+        windows = []
+
+        with self.stage("outlier_mask") as record:
+            for start_time, end_time, window in self.fit_windows(between, min_duration):
+
+                keep = valid[window]
+                index = window if keep.all() else window.start + np.flatnonzero(keep)
+                # The window itself (a view) unless some of it was despiked
+
+                data = self.binned.columns[col][index]
+                # Sets specific array of interest
             
-                t_data = (self.dt_data - self.dt_data[0]).dt.total_seconds().loc[mask]
+                t_data = (times[index] - times[0]) / 1e9
                 # Turns timestamps into seconds since "t = 0" 
                 # so we can look at warming / second
 
-                date = pd.Timestamp(start_time + (end_time - start_time) / 2).strftime("%d %B %Y")
-                # Sets the "date" of a cold period
-                # to the middle date in the window
-        
-                fitparams, fit_errs = fit_format(curve_fit(lin_fit, t_data, self.data))
-                slope, intercept = fitparams
-                slope_err, intercept_err = fit_errs
-                chi_sq = get_chi_sq(self.data, lin_fit(t_data, slope, intercept), self.uncert)
-                DOF = len(self.data)
-                # Gets fit parameters and error (error = sqrt(diag(cov_matrix)))
-
-                self.dates, self.masks, self.slopes, self.intercepts,\
-                self.slope_errs, self.intercept_errs, self.chi_sq, self.DOF = \
-                append_to_each([self.dates, self.masks, self.slopes, self.intercepts,\
-                                self.slope_errs, self.intercept_errs, self.chi_sq, self.DOF],\
-                               [date, mask, slope, intercept, slope_err, intercept_err, chi_sq, DOF])
-                # Append fit data to respective lists
-                
-                
-                if show_plot:
-                    show_fits(self.dt_data, mask, self.data, col, with_fit, t_data, slope,\
-                              intercept, chi_sq, DOF, start_time, end_time, data_label)
-        plt.show()
+                windows.append((start_time, end_time, window, index, data, t_data))
+            record["rows"] = sum(w[2].stop - w[2].start for w in windows)
+
+        with self.stage("fit", sum(len(w[4]) for w in windows)):
+            fitparams, fit_errs, _, chi_sqs, _ = \
+            batch_lin_fit([w[5] for w in windows], [w[4] for w in windows], self.uncert)
+            # Fits every window at once (error = sqrt(diag(cov_matrix)))
+
+        fits = np.zeros(len(windows), dtype = FIT_DTYPE)
+        fits["start"] = [w[0] for w in windows]
+        fits["end"] = [w[1] for w in windows]
+        fits["slope"], fits["intercept"] = fitparams.T
+        fits["slope_err"], fits["intercept_err"] = fit_errs.T
+        fits["slope_lo"], fits["slope_hi"] = self.slope_bounds([w[5] for w in windows], [w[4] for w in windows]).T
+        fits["chi_sq"] = chi_sqs
+        fits["DOF"] = [len(w[4]) for w in windows]
+        fits["i_start"] = [w[2].start for w in windows]
+        fits["i_stop"] = [w[2].stop for w in windows]
+        # One record per window; its "date" is the middle of the window
+
+        return fits, windows
+
+    def slope_bounds(self, t_list, data_list):
+        # Bootstrap intervals of the slopes of the windows (see bootstrap_intervals), NaN if n_boot is 0
+        if not self.n_boot:
+            return np.full((len(t_list), 2), np.nan)
+        with self.stage("bootstrap", sum(len(t) for t in t_list) * self.n_boot):
+            return bootstrap_intervals(t_list, data_list, self.n_boot, self.confidence,\
+                                       n_workers = self.boot_workers)
+
+    def segment_windows(self, col, windows):
+        """
+        Splits each window into regimes of different warming rates and fits them.
+
+        Compressor cycling or pressure events change the warming rate within a cold
+        period; linear_changepoints finds where, and every segment gets its own fit.
+
+        Args:
+            col: String, column label of the windows
+            windows: The windows of fit_column
+
+        Returns:
+            The results_table of the segments, indexed by (column, period, segment)
+            where period numbers the windows in time order
+
+        """
+
+        min_size = self.min_segment / pd.Timedelta(minutes = self.n_minutes)
+        t_list, data_list, periods, numbers, spans = [], [], [], [], []
+        with self.stage("segment", sum(len(w[4]) for w in windows)):
+            for period, (_, _, window, index, data, t_data) in enumerate(windows):
+                positions = np.arange(window.start, window.stop) if isinstance(index, slice) else index
+                bounds = linear_changepoints(t_data, data, self.segment_penalty, min_size)
+                for number, (a, b) in enumerate(zip(bounds[:-1], bounds[1:])):
+                    t_list.append(t_data[a:b])
+                    data_list.append(data[a:b])
+                    periods.append(period)
+                    numbers.append(number)
+                    spans.append((positions[a], positions[b - 1] + 1))
+
+        with self.stage("fit", sum(len(t) for t in t_list)):
+            fitparams, fit_errs, _, chi_sqs, _ = batch_lin_fit(t_list, data_list, self.uncert)
+
+        spans = np.array(spans, dtype = np.int64).reshape(-1, 2)
+        fits = np.zeros(len(t_list), dtype = FIT_DTYPE)
+        fits["start"] = self.binned.times[spans[:, 0]].view("datetime64[ns]")
+        fits["end"] = self.binned.times[spans[:, 1] - 1].view("datetime64[ns]")
+        fits["slope"], fits["intercept"] = fitparams.T
+        fits["slope_err"], fits["intercept_err"] = fit_errs.T
+        fits["slope_lo"], fits["slope_hi"] = self.slope_bounds(t_list, data_list).T
+        fits["chi_sq"] = chi_sqs
+        fits["DOF"] = [len(t) for t in t_list]
+        fits["i_start"], fits["i_stop"] = spans.T
+        # Same records as the windows themselves, bounded by the first and last bin of each segment
+
+        index = pd.MultiIndex.from_arrays([[col] * len(periods), periods, numbers],\
+                                          names = ["column", "period", "segment"])
+        return results_table(fits, index)
+
+    def process_data(self, col, data_label, between = (None, None), show_plot = True,\
+                     with_fit = True, min_duration = "12h", segment = False):
+        """
+        Fits the warming rate of every cold period (or one window) of a column and plots them.
+
+        Args:
+            col: String, column label in the output of the SHT logger
+            data_label: Label of the quantity, e.g. "Temperature [K]"
+            between: (start, end) of the one window to fit, or (None, None) for every
+                     cold period
+            show_plot: bool, True to draw the data of each window
+            with_fit: bool, True to draw the fit lines too
+            min_duration: Shortest window to fit, e.g. "12 h"
+            segment: bool, True to also fit each regime of the windows (see
+                     segment_windows), left in self.segments
+
+        Returns:
+            The results_table of the fits, indexed by (column, period); the records
+            are also left in self.fits
+
+        """
+
+        self.refresh([col])
+
+        min_duration = timedelta_from_duration(min_duration)
+        # Sets the shortest window of time to be analyzed
+
+        if "temperature" in data_label.lower():
+            self.uncert = 0.1
+        # Distinguishes PtCo data from other columns
+
+        key = self.result_key(col, between, min_duration)
+        if key in self.results:
+            self.results.move_to_end(key)
+            self.set_span(between)
+            # Only what plotting needs is redone
+        else:
+            self.results[key] = self.fit_column(col, between, min_duration)
+            if len(self.results) > self.max_results:
+                self.results.popitem(last = False)
+        fits, windows = self.results[key]
+        self.fits = fits.copy()
+        if windows:
+            self.data = windows[-1][4]
+
+        self.segments = None
+        if segment:
+            segment_key = key + ("segments", self.segment_penalty, self.min_segment)
+            if segment_key not in self.results:
+                self.results[segment_key] = self.segment_windows(col, windows)
+                if len(self.results) > self.max_results:
+                    self.results.popitem(last = False)
+            self.results.move_to_end(segment_key)
+            self.segments = self.results[segment_key].copy()
+            # Per-segment fits of every window, see segment_windows
+
+        if show_plot:
+            import matplotlib.pyplot as plt
+            from .graphing_tools import fit_axes, show_fits
+            # Only on the first plot, so headless runs never load matplotlib
+
+            with self.stage("plot", sum(len(w[4]) for w in windows)):
+                axes = fit_axes(len(windows), self.plots_per_page)
+                for period, (ax, fit, (start_time, end_time, window, index, data, t_data))\
+                in enumerate(zip(axes, self.fits, windows)):
+                    segments = None
+                    if self.segments is not None:
+                        rows = self.segments.loc[(col, period)]
+                        positions = np.arange(window.start, window.stop) if isinstance(index, slice) else index
+                        segments = list(zip(np.searchsorted(positions, rows["i_start"]),\
+                                            np.searchsorted(positions, rows["i_stop"]),\
+                                            rows["slope"], rows["intercept"]))
+                        # Bounds of each segment in 'data'
+                    show_fits(self.dt_data, index, data, col, with_fit, t_data, fit["slope"],\
+                              fit["intercept"], fit["chi_sq"], fit["DOF"], start_time, end_time, data_label,\
+                              ax = ax, max_points = self.max_points,\
+                              fontsize = 20 if self.plots_per_page == 1 else 12, segments = segments)
+            plt.show()
+
+        return results_table(self.fits, pd.MultiIndex.from_product([[col], range(len(self.fits))],\
+                                                                    names = ["column", "period"]))
+
+    def process_data_multi(self, columns, data_labels, between = (None, None), min_duration = "12h"):
+        """
+        Fits every window of several columns at once, without plotting.
+
+        The windows are found once for all columns, and the fits of every (column,
+        window) pair, on the data left by despike, run as one vectorized batch, so a
+        sweep over all sensors costs about as much as process_data on one of them.
+
+        Args:
+            columns: List of column labels in the output of the SHT logger
+            data_labels: Label of the quantity in each column, e.g. "Temperature [K]"
+            between: (start, end) of the one window to fit, or (None, None) for every
+                     cold period
+            min_duration: Shortest window to fit, e.g. "12 h"
+
+        Returns:
+            A DataFrame with the fields of FIT_DTYPE, indexed by (column, period)
+            where period numbers the windows in time order
+
+        """
+
+        columns = list(columns)
+        self.refresh(columns)
+
+        min_duration = timedelta_from_duration(min_duration)
+        # Sets the shortest window of time to be analyzed
+
+        times = self.binned.times
+        periods = self.fit_windows(between, min_duration)
+        windows = [window for _, _, window in periods]
+        n_windows = len(windows)
+
+        temperature = np.array(["temperature" in label.lower() for label in data_labels], dtype = bool)
+
+        with self.stage("outlier_mask", sum(w.stop - w.start for w in windows) * len(columns)):
+            positions, seg = window_positions(windows)
+            values = np.stack([self.binned.columns[col][positions] for col in columns])
+            keep = np.stack([self.binned.valid[col][positions] for col in columns])
+            # Data and validity masks of every window, one row per column
+
+        col_i, point_i = np.nonzero(keep)
+        # Column and point of every datum kept, column by column
+        with self.stage("fit", len(point_i)):
+            t_data = (times[positions] - times[0]) / 1e9
+            uncert = np.where(temperature, 0.1, 1.)
+            # Uncertainty in each column, as set by process_data
+            fitparams, fit_errs, _, chi_sqs, _ = \
+            segment_lin_fit(t_data[point_i], values[col_i, point_i], 1. / uncert[col_i]**2,\
+                            col_i * n_windows + seg[point_i], len(columns) * n_windows)
+
+        fits = np.zeros(len(columns) * n_windows, dtype = FIT_DTYPE)
+        fits["start"] = np.tile([p[0] for p in periods], len(columns))
+        fits["end"] = np.tile([p[1] for p in periods], len(columns))
+        fits["slope"], fits["intercept"] = fitparams.T
+        fits["slope_err"], fits["intercept_err"] = fit_errs.T
+        sets = np.cumsum(np.bincount(col_i * n_windows + seg[point_i], minlength = len(fits)))[:-1]
+        # Data are in (column, window) order, so each fit's data is one run of them
+        fits["slope_lo"], fits["slope_hi"] = self.slope_bounds(np.split(t_data[point_i], sets),\
+                                                               np.split(values[col_i, point_i], sets)).T
+        fits["chi_sq"] = chi_sqs
+        fits["DOF"] = np.bincount(col_i * n_windows + seg[point_i], minlength = len(fits))
+        fits["i_start"] = np.tile([w.start for w in windows], len(columns))
+        fits["i_stop"] = np.tile([w.stop for w in windows], len(columns))
+        # Same records as process_data leaves in self.fits, column after column
+
+        index = pd.MultiIndex.from_product([columns, range(n_windows)], names = ["column", "period"])
+        return results_table(fits, index)
@@ -0,0 +1,241 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from .format_tools import standardize_datetime_chunks
+from .cache_tools import file_fingerprint
+
+
+
+ARCHIVE_VERSION = 1
+# Bump whenever the layout of an archive changes
+
+MANIFEST = "manifest.json"
+
+
+def is_archive(path):
+# True if 'path' is an archive directory written by build_archive
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+def read_log(filepath, chunksize = 10**6):
+# Every column of an SHT log as int64 ns timestamps and a dict of float64 arrays
+    chunks = list(standardize_datetime_chunks(filepath, None, chunksize))
+    df = pd.concat(chunks, ignore_index = True) if chunks else pd.read_csv(filepath, nrows = 0)
+    times = df["date-time"].to_numpy().astype("datetime64[ns]").view(np.int64)
+    return times, {col: df[col].to_numpy(dtype = np.float64) for col in df.columns if col != "date-time"}
+
+def build_archive(filepaths, archive_dir, chunksize = 10**6):
+    """
+    Merges SHT logs into one time-sorted, deduplicated archive of memory-mappable arrays.
+
+    The archive is a directory holding the timestamps (int64 ns since the epoch) and each
+    sensor column (float64) as its own .npy file, and a JSON manifest naming them. Rows
+    are sorted by time and rows with the same timestamp are only kept once: the copy
+    already in the archive, else the one from the earliest file in 'filepaths'. Columns
+    a log doesn't have are NaN over its rows.
+
+    Building into an existing archive only reads the logs that aren't in it yet (going by
+    file_fingerprint), so it can be rerun as the logger writes new files. The archive is
+    rewritten as a new generation of files and the manifest replaced last, so readers
+    never see a half written archive. The new rows are slotted in between the rows of the
+    archive, which are copied over a chunk at a time from its memory maps; when the new
+    logs start after its end, as they do while the logger writes them, that is an append.
+    Only the new logs and a chunk of one column of the archive are held in memory.
+
+    Args:
+        filepaths: Paths to SHT logger csvs
+        archive_dir: The archive directory, created if needed
+        chunksize: Rows of a log read at a time
+
+    Returns:
+        The number of rows in the archive
+
+    """
+
+    os.makedirs(archive_dir, exist_ok = True)
+    old = Archive(archive_dir) if is_archive(archive_dir) else None
+    sources = [] if old is None else old.manifest["sources"]
+
+    new_sources = [file_fingerprint(f) for f in filepaths]
+    new_sources = [f for f in new_sources if f not in sources]
+    if old is not None and not new_sources:
+        return len(old)
+
+    new_parts = [read_log(source["path"], chunksize) for source in new_sources]
+    names = list(dict.fromkeys(([] if old is None else old.names())\
+                               + [col for _, columns in new_parts for col in columns]))
+    times = np.concatenate([part_times for part_times, _ in new_parts])
+    order = np.argsort(times, kind = "stable")
+    # Stable, so the earliest file comes first among equal timestamps
+    times, first = np.unique(times[order], return_index = True)
+    rows = order[first]
+    # Position in the concatenated logs of the row kept for each timestamp
+
+    old_times = np.empty(0, dtype = np.int64) if old is None else old.times
+    at = np.searchsorted(old_times, times)
+    if len(old_times):
+        fresh = (at == len(old_times)) | (old_times[np.minimum(at, len(old_times) - 1)] != times)
+        times, rows, at = times[fresh], rows[fresh], at[fresh]
+        # Timestamps already in the archive keep their row there
+    slots = at + np.arange(len(times))
+    # Row of the new archive each new row goes to; the rows of the archive fill the others, in order.
+    # New logs usually start after the end of the archive, and then this is a plain append
+    n_rows = len(old_times) + len(times)
+
+    generation = 0 if old is None else old.manifest["generation"] + 1
+    files = {"date-time": "times_%d.npy" % generation}
+    files.update({col: "col_%d_%d.npy" % (i, generation) for i, col in enumerate(names)})
+
+    all_times = save_blocks(os.path.join(archive_dir, files["date-time"]), n_rows, np.int64,\
+                            interleave(old_times, times, slots, n_rows, chunksize))
+    for col in names:
+        values = np.concatenate([columns[col] if col in columns else np.full(len(part_times), np.nan)\
+                                 for part_times, columns in new_parts])
+        save_blocks(os.path.join(archive_dir, files[col]), n_rows, np.float64,\
+                    interleave(old[col] if old is not None and col in old else None, values[rows],\
+                               slots, n_rows, chunksize))
+        # One column of the new logs and one chunk of the archive in memory at a time
+
+    manifest = {"version": ARCHIVE_VERSION, "generation": generation, "columns": names, "files": files,\
+                "rows": n_rows, "start": str(all_times[:1].view("datetime64[ns]")[0]) if n_rows else None,\
+                "end": str(all_times[-1:].view("datetime64[ns]")[0]) if n_rows else None,\
+                "sources": sources + new_sources}
+    tmp_path = os.path.join(archive_dir, MANIFEST + ".%d.tmp" % os.getpid())
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent = 1)
+    os.replace(tmp_path, os.path.join(archive_dir, MANIFEST))
+
+    if old is not None:
+        del all_times, old_times
+        for name in old.manifest["files"].values():
+            try:
+                os.remove(os.path.join(archive_dir, name))
+            except OSError:
+                pass
+        # Readers that still map the previous generation keep their copy until they close it
+
+    return n_rows
+
+def save_blocks(path, n_rows, dtype, blocks):
+# Writes the arrays 'blocks' one after the other to a new .npy file of n_rows values,
+# without holding more than one of them in memory. Returns the file memory-mapped
+    out = np.lib.format.open_memmap(path, mode = "w+", dtype = dtype, shape = (n_rows,))
+    first = 0
+    for block in blocks:
+        out[first:first + len(block)] = block
+        first += len(block)
+    out.flush()
+    return out
+
+def interleave(old_values, new_values, slots, n_rows, chunksize):
+# The n_rows of a column of the new archive 'chunksize' at a time: 'new_values' at the
+# (sorted) rows 'slots', and 'old_values' (e.g. a memory map, None for NaN) in order around them
+    for first in range(0, n_rows, chunksize):
+        stop = min(first + chunksize, n_rows)
+        i, j = np.searchsorted(slots, [first, stop])
+        is_new = np.zeros(stop - first, dtype = bool)
+        is_new[slots[i:j] - first] = True
+        block = np.empty(stop - first, dtype = new_values.dtype)
+        block[is_new] = new_values[i:j]
+        block[~is_new] = np.nan if old_values is None else old_values[first - i:stop - j]
+        # Rows before 'first' hold i new ones, so the archive continues at its row first - i
+        yield block
+
+
+class Archive:
+    """
+    Read-only, memory-mapped view of an archive written by build_archive.
+
+    Opening an archive only reads its manifest and the headers of its arrays. Windows of
+    time are found by binary search on the timestamps, and only the pages of the
+    columns and rows that are actually read get loaded from disk.
+    """
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        with open(os.path.join(archive_dir, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest["version"] != ARCHIVE_VERSION:
+            raise ValueError("%s is a version %s archive, expected version %d"\
+                             % (archive_dir, self.manifest["version"], ARCHIVE_VERSION))
+        self.times = self.open("date-time")
+        self._columns = {}
+
+    def open(self, col):
+        # Memory maps the file of column 'col'
+        return np.load(os.path.join(self.archive_dir, self.manifest["files"][col]), mmap_mode = "r")
+
+    def names(self):
+        return list(self.manifest["columns"])
+
+    def __getitem__(self, col):
+        # Memory-mapped array of column 'col'
+        if col not in self._columns:
+            if col not in self.manifest["columns"]:
+                raise KeyError("%s is not in the archive %s" % (col, self.archive_dir))
+            self._columns[col] = self.open(col)
+        return self._columns[col]
+
+    def __contains__(self, col):
+        return col in self.manifest["columns"]
+
+    def __len__(self):
+        return len(self.times)
+
+    def window(self, start = None, end = None):
+        # Slice of the rows between 'start' and 'end' (datetimes, inclusive; None for no bound)
+        i_start = 0 if start is None else\
+                  np.searchsorted(self.times, pd.Timestamp(start).as_unit("ns").value, side = "left")
+        i_stop = len(self.times) if end is None else\
+                 np.searchsorted(self.times, pd.Timestamp(end).as_unit("ns").value, side = "right")
+        return slice(int(i_start), int(max(i_start, i_stop)))
+
+    def read(self, columns = None, start = None, end = None, window = None):
+        """
+        The rows between 'start' and 'end', in the format of standardize_datetime.
+
+        Args:
+            columns: Columns to read ("date-time" is always included), all if None
+            start: Datetime at or after which rows are read, None for the first row
+            end: Datetime at or before which rows are read, None for the last row
+            window: Slice of rows to read instead of start and end
+
+        Returns:
+            A DataFrame with a "date-time" column and one column per sensor
+
+        """
+
+        window = self.window(start, end) if window is None else window
+        columns = self.names() if columns is None else [col for col in columns if col != "date-time"]
+        data = {"date-time": np.array(self.times[window]).view("datetime64[ns]")}
+        data.update({col: np.array(self[col][window]) for col in columns})
+        # Copies out of the maps, so the frame stays valid once the archive is rebuilt
+        return pd.DataFrame(data, copy = False)
+
+    def chunks(self, columns = None, start = None, end = None, chunksize = 10**6):
+        # Same as read, but yields the rows 'chunksize' at a time, like standardize_datetime_chunks
+        window = self.window(start, end)
+        for first in range(window.start, window.stop, chunksize):
+            yield self.read(columns, window = slice(first, min(first + chunksize, window.stop)))
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Merge SHT logs into a memory-mapped archive")
+    parser.add_argument("archive", help = "archive directory, created or updated")
+    parser.add_argument("logs", nargs = "+", help = "SHT logger csvs, or folders of them")
+    args = parser.parse_args(argv)
+
+    filepaths = []
+    for path in args.logs:
+        if os.path.isdir(path):
+            filepaths += [os.path.join(path, f) for f in sorted(os.listdir(path)) if f.lower().endswith(".csv")]
+        else:
+            filepaths.append(path)
+
+    n_rows = build_archive(filepaths, args.archive)
+    print("%s holds %d rows" % (args.archive, n_rows), file = sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .analyzer import SHT_Analyzer
+from .fit_tools import process_pool
+from .data_tools import FIT_DTYPE, results_table
+from .stats_tools import StageStats, make_stats
+
+
+class AnalysisCancelled(Exception):
+# Raised by analyze_files when its 'cancel' event is set
+    pass
+
+
+def list_csvs(folder):
+# Paths of every csv log in 'folder', in the order they are listed in the GUI
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder))\
+            if os.path.isfile(os.path.join(folder, f)) and f.lower().endswith(".csv")]
+
+def analyze_file(filepath, col, data_label, min_duration = "12h", use_cache = True, stats = None,\
+                 n_minutes = 10, n_boot = 0, segment = False):
+    """
+    Fits the warming rate of every cold period in a single log file.
+
+    Module-level so it can be shipped to worker processes.
+
+    Args:
+        filepath: Path to an SHT logger csv
+        col: String, column label in the output of the SHT logger
+        data_label: String, the label of the quantity, e.g. "Temperature [K]"
+        min_duration: Shortest cold period to fit, e.g. "12 h"
+        use_cache: bool, True to read / write the binned data cache
+        stats: Optional StageStats recording the stages of the analysis
+        n_minutes: Width of the bins in minutes
+        n_boot: Block bootstrap resamples per cold period, 0 for no slope intervals
+        segment: bool, True to fit each regime of the cold periods (see segment_windows)
+                 instead of the whole periods
+
+    Returns:
+        (table, records): the results_table of process_data (or of its segments) and
+        the stage records added to 'stats' by this file
+
+    """
+
+    stats = make_stats(stats)
+    n_records = len(stats.records)
+    sa = SHT_Analyzer(filepath, columns = [col], use_cache = use_cache, stats = stats,\
+                      n_minutes = n_minutes)
+    return analyze_loaded(sa, col, data_label, min_duration, n_boot, segment),\
+           sa.stats.records[n_records:]
+
+def analyze_loaded(sa, col, data_label, min_duration = "12h", n_boot = 0, segment = False):
+    # analyze_file for an analyzer already loaded, e.g. by a Prefetcher: returns its table.
+    # Works on a copy (see SHT_Analyzer.copy), so the analyzer can be in use elsewhere
+    sa = sa.copy()
+    sa.n_boot = n_boot
+    table = sa.process_data(col, data_label, min_duration = min_duration,\
+                            with_fit = False, show_plot = False, segment = segment)
+    return sa.segments if segment else table
+
+def fit_file(filepath, columns, data_labels, min_duration = "12h", use_cache = True, stats = None,\
+             n_minutes = 10, n_boot = 0):
+    """
+    Fits every cold period of several columns of a single log file, with process_data_multi.
+
+    Module-level so it can be shipped to worker processes.
+
+    Args:
+        filepath: Path to an SHT logger csv
+        columns: List of column labels in the output of the SHT logger
+        data_labels: Label of the quantity in each column, e.g. "Temperature [K]"
+        min_duration: Shortest cold period to fit, e.g. "12 h"
+        use_cache: bool, True to read / write the binned data cache
+        stats: Optional StageStats recording the stages of the analysis
+        n_minutes: Width of the bins in minutes
+        n_boot: Block bootstrap resamples per cold period, 0 for no slope intervals
+
+    Returns:
+        (table, records): the table of process_data_multi and the stage records
+        added to 'stats' by this file
+
+    """
+
+    stats = make_stats(stats)
+    n_records = len(stats.records)
+    sa = SHT_Analyzer(filepath, columns = columns, use_cache = use_cache, stats = stats,\
+                      n_minutes = n_minutes)
+    sa.n_boot = n_boot
+    return sa.process_data_multi(columns, data_labels, min_duration = min_duration),\
+           sa.stats.records[n_records:]
+
+def map_files(func, filepaths, args, n_workers = None, progress = None, stats = None, cancel = None,\
+              on_error = None, **kwargs):
+    """
+    Runs func(filepath, *args, stats = ..., **kwargs) on every file, on a pool of worker processes.
+
+    Files are analyzed in whatever order the workers finish, but results are
+    always returned in the order of 'filepaths'. func must be module-level and
+    return a tuple whose last item is the list of stage records it added to 'stats'.
+
+    Args:
+        func: Function analyzing one file, like analyze_file
+        filepaths: Paths to SHT logger csvs
+        args: Tuple of the other positional arguments of func
+        n_workers: Number of worker processes, defaults to the number of cores.
+                   1 runs everything in the calling process.
+        progress: Optional callable, called as progress(n_done, n_total) after each file
+        stats: Optional StageStats, which gets the stage records of every file.
+               Workers record into their own copy (without its hook, which stays
+               in this process) and send the records back.
+        cancel: Optional threading.Event; once it is set no more files are started and
+                AnalysisCancelled is raised. Files already running in worker
+                processes are left to finish in the background.
+        on_error: Optional callable; a file func fails on is then skipped, its result
+                  being None, after calling on_error(filepath, exception). Without it
+                  the first failure is raised.
+        kwargs: Keyword arguments of func
+
+    Returns:
+        The list of what func returned for each file
+
+    """
+
+    filepaths = list(filepaths)
+    results = [None] * len(filepaths)
+
+    if n_workers == 1 or len(filepaths) < 2:
+        for i, filepath in enumerate(filepaths):
+            if cancel is not None and cancel.is_set():
+                raise AnalysisCancelled()
+            try:
+                results[i] = func(filepath, *args, stats = stats, **kwargs)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(filepath, e)
+            if progress is not None:
+                progress(i + 1, len(filepaths))
+        return results
+
+    worker_stats = None if stats is None else\
+                   StageStats(stats.enabled, stats.trace_memory)
+    pool = process_pool(n_workers)
+    try:
+        futures = {pool.submit(func, filepath, *args, stats = worker_stats, **kwargs): i\
+                   for i, filepath in enumerate(filepaths)}
+        pending = set(futures)
+        n_done = 0
+        while pending:
+            done, pending = wait(pending, timeout = None if cancel is None else 0.1,\
+                                 return_when = FIRST_COMPLETED)
+            # Wakes up regularly to check 'cancel'
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    if on_error is None:
+                        raise
+                    on_error(filepaths[i], e)
+                n_done += 1
+                if progress is not None:
+                    progress(n_done, len(filepaths))
+            if cancel is not None and cancel.is_set():
+                raise AnalysisCancelled()
+    finally:
+        pool.shutdown(wait = cancel is None or not cancel.is_set(), cancel_futures = True)
+
+    if stats is not None:
+        for result in results:
+            if result is not None:
+                stats.extend(result[-1])
+        # Records are merged in file order, like the fit results
+
+    return results
+
+def stack_tables(tables, filepaths):
+# Stacks the results tables of each file into one indexed by (file, ...), file being
+# the name of the log; pd.concat copies whole columns, never rows one by one.
+# Files whose table is None (see map_files' on_error) are left out
+    filepaths = [f for f, table in zip(filepaths, tables) if table is not None]
+    tables = [table for table in tables if table is not None]
+    if not tables:
+        return results_table(np.zeros(0, dtype = FIT_DTYPE), pd.MultiIndex.from_arrays([[], [], []],\
+                             names = ["file", "column", "period"]))
+    return pd.concat(tables, keys = [os.path.basename(f) for f in filepaths], names = ["file"])
+
+def analyze_files(filepaths, col, data_label, min_duration = "12h", n_workers = None,\
+                  progress = None, use_cache = True, stats = None, cancel = None, n_minutes = 10,\
+                  n_boot = 0, segment = False, prefetcher = None):
+    """
+    Fits the warming rates of many log files on a pool of worker processes.
+
+    Files a Prefetcher already holds with 'col' loaded (binned at the same width) are
+    fitted in this process instead, without reading them again, while the pool works
+    through the others.
+
+    Args:
+        filepaths: Paths to SHT logger csvs
+        col: String, column label in the output of the SHT logger
+        data_label: String, the label of the quantity, e.g. "Temperature [K]"
+        min_duration: Shortest cold period to fit, e.g. "12 h"
+        n_workers, progress, stats, cancel: As for map_files
+        use_cache: bool, True to read / write the binned data cache
+        n_minutes: Width of the bins in minutes
+        n_boot: Block bootstrap resamples per cold period, 0 for no slope intervals
+        segment: bool, True for the rates of each regime of the cold periods (see
+                 segment_windows)
+        prefetcher: Optional Prefetcher whose loaded analyzers are reused
+
+    Returns:
+        The results tables of every file, stacked and indexed by (file, column, period)
+        (and segment); file is the name of the log
+
+    """
+
+    filepaths = list(filepaths)
+    loaded = {}
+    if prefetcher is not None:
+        for filepath in filepaths:
+            sa = prefetcher.peek(filepath)
+            if sa is not None and sa.n_minutes == n_minutes and col in sa.binned:
+                loaded[filepath] = sa
+    rest = [f for f in filepaths if f not in loaded]
+    # Files without the column loaded would be parsed here one after the other
+
+    n_done = [0]
+    lock = threading.Lock()
+    def done_one(*_):
+        # Progress over both the pool and the files fitted here
+        with lock:
+            n_done[0] += 1
+            if progress is not None:
+                progress(n_done[0], len(filepaths))
+
+    tables = {}
+    with ThreadPoolExecutor(max_workers = 1) as runner:
+        pooled = runner.submit(map_files, analyze_file, rest, (col, data_label, min_duration, use_cache),\
+                               n_workers, done_one, stats, cancel, n_minutes = n_minutes,\
+                               n_boot = n_boot, segment = segment)
+        # Files are spread over the workers; the cold periods of a file are bootstrapped in its
+        # worker. The pool is started first, so it is busy while the loaded files are fitted
+        for filepath, sa in loaded.items():
+            if cancel is not None and cancel.is_set():
+                raise AnalysisCancelled()
+            tables[filepath] = analyze_loaded(sa, col, data_label, min_duration, n_boot, segment)
+            done_one()
+        tables.update(zip(rest, (r[0] for r in pooled.result())))
+
+    return stack_tables([tables[f] for f in filepaths], filepaths)
+
+def fit_files(filepaths, columns, data_labels, min_duration = "12h", n_workers = None,\
+              progress = None, use_cache = True, stats = None, cancel = None, n_minutes = 10,\
+              n_boot = 0, on_error = None):
+    """
+    Fits every cold period of several columns of many log files on a pool of worker processes.
+
+    Args:
+        filepaths: Paths to SHT logger csvs
+        columns: List of column labels in the output of the SHT logger
+        data_labels: Label of the quantity in each column, e.g. "Temperature [K]"
+        min_duration: Shortest cold period to fit, e.g. "12 h"
+        n_workers, progress, stats, cancel, on_error: As for map_files
+        use_cache: bool, True to read / write the binned data cache
+        n_minutes: Width of the bins in minutes
+        n_boot: Block bootstrap resamples per cold period, 0 for no slope intervals
+
+    Returns:
+        The tables of process_data_multi of every file, stacked and indexed by
+        (file, column, period); file is the name of the log. Files skipped by
+        on_error have no rows
+
+    """
+
+    filepaths = list(filepaths)
+    results = map_files(fit_file, filepaths, (columns, data_labels, min_duration, use_cache),\
+                        n_workers, progress, stats, cancel, on_error, n_minutes = n_minutes, n_boot = n_boot)
+    return stack_tables([None if r is None else r[0] for r in results], filepaths)
+
+def analyze_folder(folder, col, data_label, **kwargs):
+# Runs analyze_files on every csv log in 'folder'
+    return analyze_files(list_csvs(folder), col, data_label, **kwargs)
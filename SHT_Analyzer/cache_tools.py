@@ -0,0 +1,211 @@
+import os
+import json
+import hashlib
+import zipfile
+import tempfile
+import numpy as np
+from .data_tools import BinnedData
+from .pyramid_tools import AggregatePyramid
+
+
+
+CACHE_VERSION = 4
+# Bump whenever the layout of a cache entry or the binning / cold range
+# logic changes, so stale entries are never reused
+
+CACHE_DIR = os.environ.get("SHT_ANALYZER_CACHE",\
+                           os.path.join(os.path.expanduser("~"), ".cache", "SHT_Analyzer"))
+MAX_CACHE_BYTES = 1 << 30
+# Total size of the cache directory before the least recently used entries are evicted
+
+HASH_BLOCK = 1 << 20
+# Bytes hashed from the start and the end of each log file
+
+
+def file_fingerprint(filepath):
+    """
+    Identifies a log file by path, size, modification time and content.
+
+    Hashing a multi-hundred-MB log in full would cost about as much as parsing it,
+    so the content hash only covers the first and last HASH_BLOCK bytes. The logger
+    only ever appends, so a changed file also changes its size, mtime or tail.
+
+    Args:
+        filepath: Path to an SHT logger csv
+
+    Returns:
+        A dict with the absolute path, size, mtime (ns) and content hash of the file
+
+    """
+
+    path = os.path.abspath(filepath)
+    stat = os.stat(path)
+    content_hash = hashlib.blake2b(digest_size = 16)
+
+    with open(path, "rb") as f:
+        content_hash.update(f.read(HASH_BLOCK))
+        if stat.st_size > 2 * HASH_BLOCK:
+            f.seek(-HASH_BLOCK, os.SEEK_END)
+        content_hash.update(f.read(HASH_BLOCK))
+
+    return {"path": path, "size": stat.st_size, "mtime": stat.st_mtime_ns,\
+            "hash": content_hash.hexdigest()}
+
+def cache_key(fingerprint, params):
+    """
+    Builds the name of the cache entry for a file and a set of analysis parameters.
+
+    Args:
+        fingerprint: The output of file_fingerprint
+        params: A dict of the parameters used to bin the data and find cold ranges
+
+    Returns:
+        A hex string, unique to the (file, parameters) pair
+
+    """
+
+    key = json.dumps([CACHE_VERSION, fingerprint, params], sort_keys = True, default = str)
+    return hashlib.blake2b(key.encode(), digest_size = 16).hexdigest()
+
+def entry_path(filepath, params, cache_dir = None):
+# Location of the cache entry corresponding to 'filepath' analyzed with 'params'
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    return os.path.join(cache_dir, cache_key(file_fingerprint(filepath), params) + ".npz")
+
+READ_ERRORS = (OSError, KeyError, ValueError, EOFError, zipfile.BadZipFile)
+# What reading a missing, truncated or otherwise damaged entry can raise
+
+def write_entry(path, write):
+# Writes an entry with write(tmp_path) to a temporary file of its own, then renames it to
+# 'path', so a concurrent reader never sees a partial entry and concurrent writers (threads
+# of one process included) never share a temporary file
+    fd, tmp_path = tempfile.mkstemp(dir = os.path.dirname(path), suffix = ".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def load_cached(filepath, params, cache_dir = None):
+    """
+    Retrieves the binned data (with its validity masks) and cold ranges of a previously analyzed file.
+
+    Any entry that can't be read back (missing, truncated, older layout) counts as a miss.
+
+    Args:
+        filepath: Path to an SHT logger csv
+        params: A dict of the parameters used to bin the data and find cold ranges
+        cache_dir: Directory holding the cache, defaults to CACHE_DIR
+
+    Returns:
+        (binned, cold_ranges) if the file is cached with these parameters, None otherwise
+
+    """
+
+    try:
+        path = entry_path(filepath, params, cache_dir)
+        with np.load(path, allow_pickle = False) as entry:
+            names = entry["names"].tolist()
+            binned = BinnedData(entry["times"], {name: entry["col_%d" % i] for i, name in enumerate(names)},\
+                                {name: entry["valid_%d" % i] for i, name in enumerate(names)\
+                                 if "valid_%d" % i in entry.files})
+            cold_ranges = entry["cold_ranges"]
+        os.utime(path)
+        # Marks the entry as recently used for eviction
+    except READ_ERRORS:
+        return None
+
+    return binned, cold_ranges
+
+def store_cached(filepath, params, binned, cold_ranges, cache_dir = None,\
+                 max_bytes = MAX_CACHE_BYTES):
+    """
+    Writes the binned data and cold ranges of a file to the cache.
+
+    Each column of 'binned' is stored as its own uncompressed array, so reading an
+    entry back is a straight copy from disk. Failing to write the cache is never fatal.
+
+    Args:
+        filepath: Path to the SHT logger csv that was analyzed
+        params: A dict of the parameters used to bin the data and find cold ranges
+        binned: The binned data, a BinnedData
+        cold_ranges: The (n, 2) array of cold range edges
+        cache_dir: Directory holding the cache, defaults to CACHE_DIR
+        max_bytes: Size of the cache directory above which old entries are evicted
+
+    Returns:
+        None
+
+    """
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        path = entry_path(filepath, params, cache_dir)
+
+        columns = {"col_%d" % i: values for i, values in enumerate(binned.columns.values())}
+        columns.update({"valid_%d" % i: binned.valid[name] for i, name in enumerate(binned.names())\
+                        if name in binned.valid})
+        # Validity masks of the despiked columns, stored next to their data
+        def write(tmp_path):
+            with open(tmp_path, "wb") as f:
+                np.savez(f, names = np.array(binned.names(), dtype = str), times = binned.times,\
+                         cold_ranges = np.asarray(cold_ranges), **columns)
+        write_entry(path, write)
+    except OSError:
+        return
+
+    evict(cache_dir, max_bytes)
+
+def load_cached_pyramid(filepath, params, cache_dir = None):
+# The AggregatePyramid of a file stored by store_cached_pyramid, None on any miss
+    try:
+        path = entry_path(filepath, params, cache_dir)
+        pyramid = AggregatePyramid.load(path)
+        os.utime(path)
+    except READ_ERRORS:
+        return None
+    return pyramid
+
+def store_cached_pyramid(filepath, params, pyramid, cache_dir = None, max_bytes = MAX_CACHE_BYTES):
+# Writes the AggregatePyramid of a file to the cache, next to (and evicted like) the binned data
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+
+    try:
+        os.makedirs(cache_dir, exist_ok = True)
+        path = entry_path(filepath, params, cache_dir)
+        write_entry(path, pyramid.save)
+    except OSError:
+        return
+
+    evict(cache_dir, max_bytes)
+
+def evict(cache_dir = None, max_bytes = MAX_CACHE_BYTES):
+# Removes least recently used entries until the cache fits within 'max_bytes'
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+
+    try:
+        entries = [os.path.join(cache_dir, f) for f in os.listdir(cache_dir) if f.endswith(".npz")]
+        entries = sorted(((os.stat(f).st_mtime, os.stat(f).st_size, f) for f in entries))
+    except OSError:
+        return
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, f in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(f)
+            total -= size
+        except OSError:
+            pass
+
+def clear_cache(cache_dir = None):
+# Deletes every entry in the cache
+    evict(cache_dir, max_bytes = 0)
@@ -0,0 +1,129 @@
+# Headless batch analysis of a folder of SHT logs, for unattended runs on
+# machines without a display. Installed as the sht-analyze command:
+#
+#   sht-analyze /data/sht --columns "PtCo1(K)" "PtCo2(K)" --output fits.csv --plots trends/
+
+import os
+import sys
+import json
+import argparse
+import importlib.util
+from .data_tools import UNITS
+from .batch_tools import list_csvs, fit_files
+from .stats_tools import StageStats
+
+
+FORMATS = ["csv", "json", "parquet"]
+
+
+def fit_table(fits):
+# The table written by main: the results table of fit_files, one row per file,
+# column and period, without the positions in the binned data
+    return fits.drop(columns = ["i_start", "i_stop"]).reset_index()
+
+def output_format(path, fmt = None):
+# The format to write 'path' in, going by its extension unless 'fmt' is given;
+# raises ValueError if it is unknown or can't be written here
+    fmt = fmt or os.path.splitext(path)[1].lstrip(".").lower()
+    if fmt not in FORMATS:
+        raise ValueError("Unknown output format '%s', expected one of %s" % (fmt, ", ".join(FORMATS)))
+    if fmt == "parquet" and not any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet")):
+        raise ValueError("Writing parquet needs pyarrow or fastparquet")
+    return fmt
+
+def write_table(table, path, fmt = None):
+# Writes the table as csv, json or parquet (see output_format)
+    fmt = output_format(path, fmt)
+    if fmt == "csv":
+        table.to_csv(path, index = False)
+    elif fmt == "json":
+        records = table.astype(object).where(table.notna(), None).to_dict(orient = "records")
+        with open(path, "w") as f:
+            json.dump(records, f, indent = 1, default = lambda t: t.isoformat())
+        # Not DataFrame.to_json, which rounds to 15 decimals: rates of ~1e-7 K/s would keep 8 digits
+    else:
+        table.to_parquet(path, index = False)
+        # Needs pyarrow or fastparquet
+
+def save_trends(table, plot_dir):
+# Saves the warming trend plot of each column as a png in 'plot_dir'
+    import matplotlib
+    matplotlib.use("Agg")
+    # Before pyplot loads a backend, so no GUI toolkit is ever loaded; runs without
+    # --plots don't import matplotlib at all
+    import matplotlib.pyplot as plt
+    from .graphing_tools import show_warming_trends
+
+    os.makedirs(plot_dir, exist_ok = True)
+    paths = []
+    for col, rows in table.groupby("column", sort = False):
+        if rows["slope"].isna().all():
+            continue
+        show_warming_trends(rows, col)
+        paths.append(os.path.join(plot_dir, "".join(c if c.isalnum() else "_" for c in col)\
+                                  + "_trends.png"))
+        plt.savefig(paths[-1])
+        plt.close()
+    return paths
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Fit every cold period of a folder of SHT logs")
+    parser.add_argument("folder", help = "folder of SHT logger csvs")
+    parser.add_argument("--columns", nargs = "+", default = list(UNITS), choices = list(UNITS),\
+                        metavar = "COLUMN", help = "columns to fit (default: all of %s)" % ", ".join(UNITS))
+    parser.add_argument("--min-duration", default = "12h", help = "shortest cold period to fit")
+    parser.add_argument("--bin-minutes", type = int, default = 10, help = "width of the bins in minutes")
+    parser.add_argument("--workers", type = int, help = "worker processes (default: number of cores)")
+    parser.add_argument("--bootstrap", type = int, default = 0, metavar = "N",\
+                        help = "block bootstrap N resamples per period for slope_lo / slope_hi (default: off)")
+    parser.add_argument("--output", required = True, help = "fit table to write, .csv, .json or .parquet")
+    parser.add_argument("--format", choices = FORMATS, help = "format of --output, if not its extension")
+    parser.add_argument("--plots", metavar = "DIR", help = "also save warming trend plots in DIR")
+    parser.add_argument("--no-cache", action = "store_true", help = "don't read or write the binned data cache")
+    parser.add_argument("--stats", metavar = "PATH", help = "write per-stage timings to PATH as JSON")
+    parser.add_argument("--quiet", action = "store_true")
+    args = parser.parse_args(argv)
+
+    try:
+        output_format(args.output, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    # Before spending any time on the analysis
+
+    filepaths = list_csvs(args.folder)
+    if not filepaths:
+        parser.error("no csv files in %s" % args.folder)
+
+    def progress(n_done, n_total):
+        if not args.quiet:
+            print("Analyzed %d of %d files" % (n_done, n_total), file = sys.stderr)
+
+    failed = []
+    def on_error(filepath, error):
+        # One bad log (e.g. only a header, or missing a column) doesn't stop the others
+        failed.append(filepath)
+        print("Skipped %s: %s: %s" % (filepath, type(error).__name__, error), file = sys.stderr)
+
+    stats = StageStats() if args.stats else None
+    fits = fit_files(filepaths, args.columns, [UNITS[col] for col in args.columns],\
+                     min_duration = args.min_duration, n_workers = args.workers, progress = progress,\
+                     use_cache = not args.no_cache, stats = stats, n_minutes = args.bin_minutes,\
+                     n_boot = args.bootstrap, on_error = on_error)
+
+    table = fit_table(fits)
+    write_table(table, args.output, args.format)
+    if args.plots:
+        save_trends(table, args.plots)
+    if stats is not None:
+        stats.to_json(args.stats)
+
+    if not args.quiet:
+        print("Wrote %d fits of %d files to %s" % (len(table), len(filepaths) - len(failed), args.output),\
+              file = sys.stderr)
+    if failed:
+        print("%d of %d files failed" % (len(failed), len(filepaths)), file = sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
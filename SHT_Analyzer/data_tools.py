@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+
+
+FIT_DTYPE = np.dtype([("start", "datetime64[ns]"), ("end", "datetime64[ns]"),\
+                      ("slope", np.float64), ("intercept", np.float64),\
+                      ("slope_err", np.float64), ("slope_lo", np.float64), ("slope_hi", np.float64),\
+                      ("intercept_err", np.float64), ("chi_sq", np.float64), ("DOF", np.int64),\
+                      ("i_start", np.int64), ("i_stop", np.int64)])
+# One record per fitted window: its (truncated) bounds, the fit results, the
+# bootstrap interval of the slope (NaN unless bootstrapped, see bootstrap_intervals)
+# and the [i_start, i_stop) slice of the binned data the window covers
+
+UNITS = {"PtCo1(K)": "Temperature [K]", "PtCo2(K)": "Temperature [K]",\
+         "H2-Press(Torr)": "Pressure [Torr]", "VAC-PM": "Pressure [mbar]",\
+         "VAC-CC10 (Pa)": "Pressure [Pa]"}
+# Sensor columns of the SHT logger and the quantity each one measures
+
+VALID_RANGES = {"PtCo1(K)": (0., 300.), "PtCo2(K)": (0., 300.),\
+                "H2-Press(Torr)": (0., np.inf), "VAC-PM": (0., np.inf),\
+                "VAC-CC10 (Pa)": (0., np.inf)}
+# [low, high) range each sensor can physically read; anything else is a readout glitch
+
+RESOLUTIONS = {"PtCo1(K)": 0.01, "PtCo2(K)": 0.01,\
+               "H2-Press(Torr)": 0., "VAC-PM": 0., "VAC-CC10 (Pa)": 0.}
+# Step each sensor is logged in (0 if it isn't quantized); the Hampel filter never
+# treats a deviation this small as a spike
+
+
+class BinnedData:
+    """
+    Compact column store for binned SHT data.
+
+    Timestamps are int64 ns since the epoch and each sensor column is a plain 1-D
+    array, float64 or float32. 'valid' holds a boolean array per column once it has
+    been despiked (see valid_mask), True where the data can be fitted. Nothing else
+    is kept per row, and to_frame() wraps the arrays in a DataFrame without copying them.
+    """
+
+    __slots__ = ("times", "columns", "valid")
+
+    def __init__(self, times, columns, valid = None):
+        self.times = times
+        self.columns = columns
+        self.valid = {} if valid is None else valid
+
+    @classmethod
+    def from_frame(cls, df, dtype = np.float64):
+        # Converts a binned DataFrame (e.g. from bin_by_minute), casting sensor columns to 'dtype'
+        times = df["date-time"].to_numpy().astype("datetime64[ns]", copy = False).view(np.int64)
+        columns = {col: df[col].to_numpy().astype(dtype, copy = False)\
+                   for col in df.columns if col != "date-time"}
+        return cls(times, columns)
+
+    def to_frame(self):
+        # The data in the format of bin_by_minute, as views of the arrays
+        data = {"date-time": self.times.view("datetime64[ns]")}
+        data.update(self.columns)
+        return pd.DataFrame(data, copy = False)
+
+    def names(self):
+        return list(self.columns)
+
+    def merge(self, other):
+        # Joins the columns of 'other', keeping only bins present in both
+        _, i, j = np.intersect1d(self.times, other.times, assume_unique = True,\
+                                 return_indices = True)
+        columns = {col: values[i] for col, values in self.columns.items()}
+        columns.update({col: values[j] for col, values in other.columns.items()})
+        valid = {col: mask[i] for col, mask in self.valid.items()}
+        valid.update({col: mask[j] for col, mask in other.valid.items()})
+        return BinnedData(self.times[i], columns, valid)
+
+    def nbytes(self):
+        return self.times.nbytes + sum(values.nbytes for values in self.columns.values())\
+               + sum(mask.nbytes for mask in self.valid.values())
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, col):
+        return col in self.columns
+
+
+def results_table(fits, index):
+    """
+    The results of fits as a table, one typed column per field of FIT_DTYPE.
+
+    Built column by column from the records, so stacking the tables of many files
+    with pd.concat only copies whole columns. The middle of each window, where its
+    warming rate is plotted, is added after its bounds.
+
+    Args:
+        fits: FIT_DTYPE records
+        index: The index of the table, e.g. (column, period) pairs
+
+    Returns:
+        A DataFrame with a "midpoint" column and the fields of FIT_DTYPE
+
+    """
+
+    table = pd.DataFrame(fits, index = index)
+    table.insert(2, "midpoint", table["start"] + (table["end"] - table["start"]) // 2)
+    return table
+
+def fit_dates(fits):
+# Colloquial date of each fitted window, the middle of the window
+    midpoints = fits["start"] + (fits["end"] - fits["start"]) // 2
+    return [pd.Timestamp(t).strftime("%d %B %Y") for t in midpoints]
+
+def fit_field(name):
+# Read-only access to one field of the fit results, for classes storing them in self.fits
+    return property(lambda self: self.fits[name])
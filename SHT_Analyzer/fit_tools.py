@@ -1,8 +1,20 @@
 import pandas as pd
 import numpy as np
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .state_tools import *
+
+
+
+def process_pool(n_workers = None):
+# Pool of worker processes started without fork: forking a process that runs threads
+# (the GUI's prefetcher, the runner of analyze_files) can deadlock in the child.
+# forkserver forks them from a clean server process, spawn starts fresh interpreters
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers = n_workers, mp_context = multiprocessing.get_context(method))
 
 def bin_by_minute(df, n_minutes):
-"""
+    """
     Bins data into histograms of width n_minutes.
     
     Take mean of all values (dropping NaNs) within the same n_minutes minutes 
@@ -16,12 +28,68 @@ def bin_by_minute(df, n_minutes):
     Returns:
         The rebinned df, in the same format as it was before.
     
-"""
+    """
     
     return df.resample("%d min" % n_minutes, on = "date-time").mean().dropna().reset_index()
-    
+
+def bin_chunks_by_minute(chunks, n_minutes):
+    """
+    Bins data arriving in chunks into histograms of width n_minutes.
+
+    Out-of-core version of bin_by_minute, giving the same output. Each chunk is reduced
+    to per-bin sums and counts of non-NaN values; the last bin of a chunk may continue
+    in the next one, so its partial sums are carried over instead of being emitted.
+    Only one chunk and the (much smaller) binned output are ever held in memory.
+
+    Args:
+        chunks: An iterable of dataframes with a "date-time" column, in time order,
+                e.g. from standardize_datetime_chunks
+        n_minutes: The width of the bins in minutes
+
+    Returns:
+        The rebinned df, in the same format as bin_by_minute.
+
+    """
+
+    width = pd.Timedelta(minutes = n_minutes)
+    origin = None
+    sums, counts = [], []
+    carry = None
+
+    for df in chunks:
+        if len(df) == 0:
+            continue
+        if origin is None:
+            origin = df["date-time"].iloc[0].normalize()
+            # Same bin edges as resample: multiples of n_minutes from midnight of the first day
+
+        keys = (origin + (df["date-time"] - origin) // width * width).to_numpy()
+        values = df.drop(columns = "date-time")
+        chunk_sums = values.groupby(keys).sum()
+        chunk_counts = values.groupby(keys).count()
+
+        if carry is not None:
+            chunk_sums = pd.concat((carry[0], chunk_sums)).groupby(level = 0).sum()
+            chunk_counts = pd.concat((carry[1], chunk_counts)).groupby(level = 0).sum()
+            # Completes the bin left open by the previous chunk
+
+        sums.append(chunk_sums.iloc[:-1])
+        counts.append(chunk_counts.iloc[:-1])
+        carry = (chunk_sums.iloc[-1:], chunk_counts.iloc[-1:])
+
+    sums = pd.concat(sums + [carry[0]])
+    counts = pd.concat(counts + [carry[1]])
+    if not sums.index.is_monotonic_increasing or not sums.index.is_unique:
+        sums = sums.groupby(level = 0).sum()
+        counts = counts.groupby(level = 0).sum()
+        # Only needed if the log wasn't in time order
+
+    means = sums / counts.where(counts > 0)
+    means.index.name = "date-time"
+    return means.dropna().reset_index()
+
 def lin_fit(x,a,b):
-"""
+    """
     Linear fitting function using scipy curve_fit.
     
     Essentially just f(x) = ax + b.
@@ -34,12 +102,12 @@ def lin_fit(x,a,b):
     Returns:
         f(x), a 1-D array representing the 'y-values' of ax + b
     
-"""
+    """
 
     return a*x + b
     
 def mask_between(data, start, end):
-"""
+    """
     Convenience function for boolean masking in a specific range.
     
     Takes an array and returns a boolean mask to select between 'start' and 'end'.
@@ -52,12 +120,34 @@ def mask_between(data, start, end):
     Returns:
         The boolean mask for selecting in that range.
     
-"""
+    """
 
     return (data >= start) & (data <= end)
 
+def slice_between(times, start, end):
+    """
+    Sorted-time counterpart of mask_between.
+
+    Since binned timestamps are sorted, the selection between 'start' and 'end' is one
+    contiguous block, found by binary search in O(log N) instead of an O(N) mask.
+    Indexing an array with the returned slice gives a view, not a copy.
+
+    Args:
+        times: A sorted 1-D int64 array of timestamps in ns since the epoch
+        start: A datetime, at or after which the data will be selected
+        end: A datetime, at or before which the data will be selected
+
+    Returns:
+        The slice selecting in that range.
+
+    """
+
+    start = np.searchsorted(times, pd.Timestamp(start).as_unit("ns").value, side = "left")
+    end = np.searchsorted(times, pd.Timestamp(end).as_unit("ns").value, side = "right")
+    return slice(int(start), int(max(start, end)))
+
 def get_chi_sq(data, modelled, uncert):
-"""
+    """
     Get chi squared, given some data, a model based on a fit, and uncertainty in each datum.
     
     Calculated chi squared based on Sum((Data - Model)**2) / (Uncertainty **2). 
@@ -71,12 +161,214 @@ def get_chi_sq(data, modelled, uncert):
     Returns:
         chi squared, WTIHOUT DIVIDING BY N_DOF
     
-"""
+    """
 
     return np.sum((data - modelled)**2 / (uncert**2))
 
+def batch_lin_fit(x_list, y_list, uncert = 1., absolute_sigma = False):
+    """
+    Weighted least squares fits of f(x) = ax + b to many datasets in one vectorized pass.
+
+    Closed-form replacement for calling curve_fit(lin_fit, x, y) once per dataset.
+    All datasets are concatenated and the weighted sums (S, Sx, Sy, Sxx, Sxy) of each
+    one are accumulated with np.bincount. x and y are centered on their weighted means
+    before the second moments are taken, so large x offsets (seconds since the start
+    of a file) don't cost any precision.
+
+    As with curve_fit, the covariance is scaled by chi squared / (N - 2) unless
+    absolute_sigma is True, which makes it independent of a uniform 'uncert'.
+
+    Args:
+        x_list: A list of 1-D arrays, the x values of each dataset
+        y_list: A list of 1-D arrays, the y values of each dataset
+        uncert: The uncertainty in each datum, either one number for all data
+                or a list of 1-D arrays shaped like y_list
+        absolute_sigma: bool, True if 'uncert' is an absolute uncertainty
+
+    Returns:
+        [params, errs, covs, chi_sq, DOF]: (n, 2) arrays of (slope, intercept) and their
+        errors, the (n, 2, 2) covariance matrices, chi squared WITHOUT DIVIDING BY N_DOF
+        and the number of degrees of freedom (N - 2) of each fit
+
+    """
+
+    n_sets = len(x_list)
+    lengths = np.array([len(x) for x in x_list], dtype = int)
+    if n_sets == 0:
+        return [np.empty((0, 2)), np.empty((0, 2)), np.empty((0, 2, 2)),\
+                np.empty(0), np.empty(0, dtype = int)]
+
+    seg = np.repeat(np.arange(n_sets), lengths)
+    x = np.concatenate([np.asarray(x, dtype = float) for x in x_list])
+    y = np.concatenate([np.asarray(y, dtype = float) for y in y_list])
+
+    if np.ndim(uncert) == 0:
+        w = np.full(len(x), 1. / float(uncert)**2)
+    else:
+        w = 1. / np.concatenate([np.asarray(u, dtype = float) for u in uncert])**2
+
+    return segment_lin_fit(x, y, w, seg, n_sets, absolute_sigma)
+
+def segment_lin_fit(x, y, w, seg, n_sets, absolute_sigma = False):
+    """
+    The fits of batch_lin_fit, on data that is already concatenated.
+
+    Args:
+        x: 1-D array, the x values of all datasets
+        y: 1-D array, the y values of all datasets
+        w: 1-D array, the weight (1 / uncertainty^2) of each datum
+        seg: 1-D int array, the dataset each datum belongs to, in [0, n_sets)
+        n_sets: Number of datasets
+        absolute_sigma: bool, True if the weights come from absolute uncertainties
+
+    Returns:
+        [params, errs, covs, chi_sq, DOF], as for batch_lin_fit
+
+    """
+
+    S = np.bincount(seg, w, minlength = n_sets)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        x_mean = np.bincount(seg, w * x, minlength = n_sets) / S
+        y_mean = np.bincount(seg, w * y, minlength = n_sets) / S
+    dx = x - x_mean[seg]
+    dy = y - y_mean[seg]
+    Sxx = np.bincount(seg, w * dx * dx, minlength = n_sets)
+    Sxy = np.bincount(seg, w * dx * dy, minlength = n_sets)
+    # Sufficient statistics of each dataset, about its weighted mean
+
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        slopes = Sxy / Sxx
+        intercepts = y_mean - slopes * x_mean
+
+        residuals = dy - slopes[seg] * dx
+        chi_sq = np.bincount(seg, w * residuals**2, minlength = n_sets)
+        DOF = np.bincount(seg, minlength = n_sets) - 2
+
+        covs = np.empty((n_sets, 2, 2))
+        covs[:, 0, 0] = 1. / Sxx
+        covs[:, 0, 1] = covs[:, 1, 0] = -x_mean / Sxx
+        covs[:, 1, 1] = 1. / S + x_mean**2 / Sxx
+        # Inverse of the weighted normal matrix, in closed form
+
+        if not absolute_sigma:
+            covs *= np.where(DOF > 0, chi_sq / DOF, np.inf)[:, None, None]
+
+    params = np.stack((slopes, intercepts), axis = 1)
+    errs = np.sqrt(np.stack((covs[:, 0, 0], covs[:, 1, 1]), axis = 1))
+
+    return [params, errs, covs, chi_sq, DOF]
+
+def block_length(residuals):
+    """
+    Block length for a moving block bootstrap of autocorrelated residuals.
+
+    Uses the optimal length for an AR(1) process, (2 rho / (1 - rho^2))^(2/3) n^(1/3),
+    with rho the lag-1 autocorrelation of the residuals: about 1 for white noise, and
+    longer the more slowly the residuals wander, as in binned cryogenic data.
+
+    Args:
+        residuals: 1-D array, the residuals of a fit in time order
+
+    Returns:
+        The block length, an int between 1 and len(residuals) // 2
+
+    """
+
+    n = len(residuals)
+    if n < 4:
+        return 1
+    r = residuals - residuals.mean()
+    rho = np.clip(np.dot(r[1:], r[:-1]) / max(np.dot(r, r), np.finfo(float).tiny), 0., 0.99)
+    length = (2 * rho / (1 - rho**2))**(2. / 3) * n**(1. / 3)
+    return int(np.clip(np.ceil(length), 1, n // 2))
+
+def bootstrap_slopes(x, y, n_boot = 2000, block_len = None, seed = None, max_elements = 1 << 22):
+    """
+    Moving block bootstrap of the slope of a straight line fit.
+
+    The residuals of the fit are resampled in circular blocks of consecutive points,
+    which keeps their autocorrelation, and added back onto the fitted line. The slope
+    is linear in the data, so each resample's slope is the fitted slope plus one dot
+    product of its residuals: all resamples are a single gather and matrix product,
+    done 'max_elements' resampled points at a time to bound memory.
+
+    Args:
+        x: 1-D array, the x values of the data
+        y: 1-D array, the y values of the data
+        n_boot: Number of resamples
+        block_len: Length of the blocks, chosen by block_length if None
+        seed: Seed or np.random.SeedSequence of the resampling
+
+    Returns:
+        A 1-D array of the n_boot resampled slopes (NaN if there are less than 3 points)
+
+    """
+
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    n = len(x)
+    if n < 3:
+        return np.full(n_boot, np.nan)
+
+    dx = x - x.mean()
+    c = dx / np.dot(dx, dx)
+    slope = np.dot(c, y)
+    residuals = y - y.mean() - slope * dx
+
+    block_len = block_length(residuals) if block_len is None else int(min(max(block_len, 1), n))
+    n_blocks = -(-n // block_len)
+    rng = np.random.default_rng(seed)
+
+    slopes = np.empty(n_boot)
+    batch = max(1, max_elements // (n_blocks * block_len))
+    for first in range(0, n_boot, batch):
+        size = min(batch, n_boot - first)
+        starts = rng.integers(0, n, size = (size, n_blocks, 1))
+        index = ((starts + np.arange(block_len)) % n).reshape(size, -1)[:, :n]
+        slopes[first:first + size] = slope + residuals[index] @ c
+    return slopes
+
+def bootstrap_interval(x, y, n_boot = 2000, confidence = 0.95, block_len = None, seed = None):
+# Percentile interval [low, high] of the slope from bootstrap_slopes, module-level for worker processes
+    slopes = bootstrap_slopes(x, y, n_boot, block_len, seed)
+    tail = 100 * (1 - confidence) / 2
+    return np.percentile(slopes, [tail, 100 - tail])
+
+def bootstrap_intervals(x_list, y_list, n_boot = 2000, confidence = 0.95, block_len = None, seed = 0,\
+                        n_workers = 1):
+    """
+    Percentile intervals of the slopes of many datasets, e.g. every cold period of a column.
+
+    Each dataset gets its own stream of random numbers, spawned from 'seed', so the
+    intervals don't depend on how the datasets are spread over workers.
+
+    Args:
+        x_list: A list of 1-D arrays, the x values of each dataset
+        y_list: A list of 1-D arrays, the y values of each dataset
+        n_boot: Number of resamples of each dataset
+        confidence: Probability covered by the intervals, e.g. 0.95 for 2.5 to 97.5 %
+        block_len: Length of the blocks, chosen per dataset if None (see block_length)
+        seed: Seed of the resampling
+        n_workers: Number of worker processes the datasets are spread over; 1 runs
+                   everything in the calling process, None uses every core
+
+    Returns:
+        An (n, 2) array of the low and high end of each interval
+
+    """
+
+    seeds = np.random.SeedSequence(seed).spawn(len(x_list))
+    args = [(x, y, n_boot, confidence, block_len, s) for x, y, s in zip(x_list, y_list, seeds)]
+    if not args:
+        return np.empty((0, 2))
+
+    if n_workers == 1 or len(args) < 2:
+        return np.array([bootstrap_interval(*a) for a in args])
+    with process_pool(n_workers) as pool:
+        return np.array(list(pool.map(bootstrap_interval, *zip(*args))))
+
 def append_to_each(containers, corresp_vals):
-"""
+    """
     Helper function to shorten appends.
     
     Appends values itemwise from 'corresp_vals' to 'containers'.
@@ -95,92 +387,228 @@ def append_to_each(containers, corresp_vals):
     
     Returns:
         chi squared, WTIHOUT DIVIDING BY N_DOF
-"""
+    """
 
     for i in range(len(containers)):
         containers[i].append(corresp_vals[i])
     return containers
     
-def find_cold_ranges(all_data):
-"""
+def find_cold_ranges(all_data, threshold = 4.5, conditions = None, min_dwell = MIN_DWELL):
+    """
     Finds ranges within temperature data where the system is cold.
-    
-    Returns pairs of datetime-convertible strings which
-    bookend windows of time where the SHT system is cold.
-    
+
+    Returns pairs of datetimes which bookend windows of time where the SHT
+    system is cold, found in one pass by a ColdDetector.
+
     Args:
-        all_data: 
-    
+        all_data: The binned DataFrame, with "date-time" and the sensor columns of 'conditions'
+        threshold: PtCo1 temperature in K below which the system counts as cold,
+                   if no 'conditions' are given
+        conditions: (enter, exit) thresholds per sensor, see ColdDetector
+        min_dwell: Shortest cold period or warm gap; shorter ones are random spikes
+
     Returns:
-        chi squared, WTIHOUT DIVIDING BY N_DOF
-    
-""" 
-    # 
+        An (n, 2) array of datetimes bookending each cold window
 
-    cond = all_data["PtCo1(K)"] < 4.5
-    # Cuts out unimportant (non-cold) data
-    
-    edges = np.where(np.diff(cond))[0]
-    # Gets indices representing "bounds" of cold windows
-    
-    if len(edges) % 2:
-        if cond.iloc[-1]:
-            edges = np.insert(edges, -1, -1)
-        elif cond.iloc[0]:
-            edges = np.insert(edges, 0, 0)
-    # Handles cases starting or ending at ~4K, would not propery bin otherwise
-    
+    """
 
-    dt_data = all_data["date-time"]
+    detector = ColdDetector({"PtCo1(K)": (threshold, threshold)} if conditions is None else conditions,\
+                            min_dwell)
+    detector.update(all_data["date-time"].to_numpy(), {col: all_data[col].to_numpy() for col in detector.columns()})
+    return detector.intervals()
 
-    unfiltered_edges = np.array(dt_data.iloc[edges])
-    # Gets bookend timstamps but includes random temperature spikes;
-    # want to filter these out
-    
-    diffs = np.diff(unfiltered_edges).astype(float)
-    rm_locs = np.where((diffs / 1e9) < (20 * 60))[0] 
-    # Convert ns to s, check less than 20 mins apart
-    rm_locs = np.concatenate((rm_locs, rm_locs + 1))
-    edges = np.delete(unfiltered_edges, rm_locs)
-    # Removes bookends that correspond to a random spike (short, usually under 20 mins)
+def hampel_mask(values, half_window = 6, n_sigmas = 3., resolution = 0.):
+    """
+    Hampel filter: flags spikes against the rolling median of their neighbourhood.
 
-    edges = np.reshape(edges, (-1, 2))
-    # Formats output into pairs
-    
-    return edges
+    A point is kept if it is within n_sigmas robust standard deviations (1.4826 times
+    the rolling median absolute deviation) of the median of the 2 * half_window + 1
+    points centered on it. Unlike a mean / std cut, a spike doesn't drag the statistics
+    of its neighbours along, and slow drifts like warming aren't cut.
 
-def apply_mask(start_time, end_time, min_duration, mask,\
-               dt_data, data, col, data_label, zscore, uncert):
-# Refines and applies mask to select specific data of interest
-    
-    not_mask = np.logical_not(mask)
-    if np.all(not_mask):
-        mask = not_mask
-    # Handles cases where dates provided to 'between' parameter
-    # are out of bounds; defaults to full time range
-    
-    if "temperature" in data_label.lower():
-        # Distinguishes PtCo data from other columns
-        mask &= (data < 300)
-        # Removes random spikes over 300K 
-        # (sometimes data spikes to 1e6 K or something)
-        if start_time != dt_data.iloc[0] and end_time != dt_data.iloc[-1]:
-            mask &= (np.abs(data.loc[mask] - np.mean(data.loc[mask]))\
-                      < zscore * np.std(data.loc[mask]))
-            # Remove outliers with z-score > self.zscore
-        uncert = 0.1
-    
-    data = data.loc[mask]
+    The MAD is floored at 'resolution': on a quantized sensor most neighbourhoods read
+    one or two values, their MAD is 0 and every step of a slow ramp would look like a spike.
 
-    return [data, mask, uncert]
-    
+    Args:
+        values: 1-D array, one column of the binned data. NaNs are ignored by the
+                rolling statistics and never kept.
+        half_window: Points on each side of the rolling window
+        n_sigmas: Width of the band of kept points, in robust standard deviations
+        resolution: Smallest MAD used, e.g. the step the sensor is logged in
 
+    Returns:
+        A boolean array like 'values', True for the points kept
 
+    """
 
+    series = pd.Series(values, copy = False)
+    median = series.rolling(2 * half_window + 1, center = True, min_periods = 1).median()
+    deviation = (series - median).abs()
+    mad = deviation.rolling(2 * half_window + 1, center = True, min_periods = 1).median().clip(lower = resolution)
+    return (deviation <= n_sigmas * 1.4826 * mad).to_numpy()
 
+def valid_mask(values, valid_range = (-np.inf, np.inf), half_window = 6, n_sigmas = 3., resolution = 0.):
+    """
+    The points of a column fit for fitting: physically possible and not a spike.
 
+    Points outside of [low, high) are dropped first (e.g. the PtCo readout sometimes
+    jumps to 1e6 K), then hampel_mask despikes what is left.
 
+    Args:
+        values: 1-D array, one column of the binned data
+        valid_range: (low, high), the range of values the sensor can physically read
+        half_window, n_sigmas, resolution: Parameters of hampel_mask
 
+    Returns:
+        A boolean array like 'values', True for the points kept
 
-    
+    """
+
+    low, high = valid_range
+    in_range = (values >= low) & (values < high)
+    return in_range & hampel_mask(np.where(in_range, values, np.nan), half_window, n_sigmas,\
+                                  resolution)
+
+def window_positions(windows):
+    """
+    Lays many windows of the binned data end to end.
+
+    Args:
+        windows: A list of slices of the binned data (see slice_between)
+
+    Returns:
+        [positions, seg]: positions in the binned data of every point of every
+        window, and the window each belongs to
+
+    """
+
+    lengths = np.array([w.stop - w.start for w in windows], dtype = int)
+    starts = np.array([w.start for w in windows], dtype = int)
+    seg = np.repeat(np.arange(len(windows)), lengths)
+    positions = np.arange(lengths.sum()) + np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return [positions, seg]
+
+def linear_changepoints(x, y, penalty = 3., min_size = 36, step = None):
+    """
+    Splits data into straight line segments by PELT (pruned exact linear time).
+
+    Minimizes the total residual sum of squares of a straight line fit to each
+    segment plus 'beta' per segment. The cost of any segment is O(1) from cumulative
+    sums of 1, x, y, x^2, xy and y^2, and PELT drops every candidate start that can't
+    be optimal any more, so the work is O(N) on average when segments keep coming.
+    Segments only start on multiples of 'step' points, which places each change to
+    within 'step' points.
+
+    Within a long segment nothing can be pruned, so PELT is quadratic in the number of
+    possible starts. The search is therefore run twice: first with starts every
+    min_size points, then with starts every 'step' points, but only within 2 * min_size
+    of the bounds the first pass found. Without any change the work is about
+    (N / min_size)^2 / 2 segment costs, 0.4 s for N = 52000 (a year of 10 minute bins,
+    see benchmarks/bench_segments.py). The second pass only moves or drops bounds of the
+    first, so a change that only pays off at the finer placement can be missed.
+
+    beta is penalty * log(N) * the long-run variance of the noise, (1 + rho) / (1 - rho)
+    times its variance, with rho its lag-1 autocorrelation: slowly wandering noise
+    looks like a change of slope far more often than white noise. Both are measured on
+    the residuals of the current segmentation, starting from segments of 4 * min_size
+    points, and the segmentation is redone until it no longer changes (at most 4 times).
+
+    Args:
+        x: 1-D array, the x values of the data, sorted
+        y: 1-D array, the y values of the data
+        penalty: Multiplier of beta, higher for fewer segments
+        min_size: Fewest points in a segment
+        step: Spacing of the possible segment starts, min_size // 6 if None
+
+    Returns:
+        A 1-D int array of segment bounds, from 0 to len(x): segment i is
+        [bounds[i], bounds[i + 1])
+
+    """
+
+    x = np.asarray(x, dtype = float)
+    y = np.asarray(y, dtype = float)
+    n = len(x)
+    min_size = max(int(min_size), 3)
+    if n < 2 * min_size:
+        return np.array([0, n])
+    step = max(1, min_size // 6 if step is None else int(step))
+
+    x = (x - x[0]) / max(x[-1] - x[0], np.finfo(float).tiny)
+    y = y - y.mean()
+    # Scaled so the cumulative sums lose no precision
+    sums = np.zeros((6, n + 1))
+    np.cumsum(np.stack((np.ones(n), x, y, x * x, x * y, y * y)), axis = 1, out = sums[:, 1:])
+
+    def line_sums(starts, end):
+        # Centered sums of squares and products of each [start, end)
+        S, Sx, Sy, Sxx, Sxy, Syy = sums[:, end].reshape(6, -1) - sums[:, starts]
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return Sx / S, Sy / S, Sxx - Sx * Sx / S, Sxy - Sx * Sy / S, Syy - Sy * Sy / S
+
+    def cost(starts, end):
+        # Residual sum of squares of a line fit to each [start, end)
+        _, _, Sxx_c, Sxy_c, Syy_c = line_sums(starts, end)
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            return np.maximum(Syy_c - np.where(Sxx_c > 0, Sxy_c * Sxy_c / Sxx_c, 0.), 0.)
+
+    def long_run_variance(bounds):
+        # Long-run variance of the residuals of a line fit to each segment
+        seg = np.repeat(np.arange(len(bounds) - 1), np.diff(bounds))
+        x_mean, y_mean, Sxx_c, Sxy_c, _ = line_sums(bounds[:-1], bounds[1:])
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            slopes = np.where(Sxx_c > 0, Sxy_c / Sxx_c, 0.)
+        residuals = y - y_mean[seg] - slopes[seg] * (x - x_mean[seg])
+        rr = max(np.dot(residuals, residuals), np.finfo(float).tiny)
+        rho = np.clip(np.dot(residuals[1:], residuals[:-1]) / rr, 0., 0.99)
+        return rr / (n - 2 * (len(bounds) - 1)) * (1 + rho) / (1 - rho)
+
+    def pelt(ends, beta):
+        # Bounds of the optimal segmentation whose segments end only at 'ends' (sorted, the
+        # last one n); also the possible starts, with 0, where they leave room for a segment
+        F = np.full(n + 1, np.inf)
+        F[0] = -beta
+        last = np.zeros(n + 1, dtype = np.int64)
+        candidates = np.array([0])
+        for end in ends:
+            totals = F[candidates] + cost(candidates, end)
+            eligible = end - candidates >= min_size
+            best = np.flatnonzero(eligible)[np.argmin(totals[eligible])]
+            # Only starts at least min_size points back can end a segment here
+            F[end] = totals[best] + beta
+            last[end] = candidates[best]
+            candidates = candidates[~eligible | (totals <= F[end])]
+            # Pruning: a start whose cost already exceeds the optimum never wins later;
+            # starts too close to end yet are kept for the later ends
+            if end <= n - min_size:
+                candidates = np.append(candidates, end)
+                # Starts that leave room for a whole segment after them
+
+        bounds = [n]
+        while bounds[-1] > 0:
+            bounds.append(last[bounds[-1]])
+        return np.array(bounds[::-1])
+
+    coarse_step = step * max(1, min_size // step)
+    coarse_ends = np.append(np.arange(min_size, n - min_size + 1, coarse_step), n)
+    # Possible segment ends of the first pass: every coarse_step points, and the end of the data
+
+    bounds = np.append(np.arange(0, max(n - 4 * min_size, 0) + 1, 4 * min_size), n)
+    for _ in range(4):
+        beta = penalty * np.log(n) * long_run_variance(bounds)
+
+        new_bounds = pelt(coarse_ends, beta)
+        if coarse_step > step:
+            near = (new_bounds[1:-1, None] + np.arange(-2 * coarse_step, 2 * coarse_step + 1, step)).ravel()
+            near = np.unique(near[(near >= min_size) & (near <= n - min_size)])
+            new_bounds = pelt(np.append(near, n), beta)
+            # The ends of the fine grid within 2 * coarse_step of a coarse bound, which include
+            # the coarse bounds themselves, so this never does worse than the first pass
+
+        if np.array_equal(new_bounds, bounds):
+            break
+        bounds = new_bounds
 
+    if np.diff(bounds).min() < min_size:
+        raise RuntimeError("linear_changepoints found a segment shorter than %d points" % min_size)
+    return bounds
@@ -1,3 +1,4 @@
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime as dt 
@@ -5,11 +6,179 @@ from datetime import timedelta
 
 
 
-def standardize_datetime(csv_filepath):
-# Read SHT csv log and ensure no funky time format survives
-    df = pd.read_csv(csv_filepath)
-    df["date-time"] = pd.to_datetime(df["date-time"], format = "%Y/%m/%d %H:%M:%S")
+def read_dtypes(csv_filepath, usecols):
+# The columns to read, date-time first and without duplicates, and their dtypes:
+# sensor columns as float64 so pandas never has to infer their type
+    if usecols is None:
+        usecols = list(pd.read_csv(csv_filepath, nrows = 0).columns)
+    usecols = list(dict.fromkeys(["date-time"] + list(usecols)))
+
+    dtypes = {col: np.float64 for col in usecols}
+    dtypes["date-time"] = str
+    return usecols, dtypes
+
+TIMESTAMP_FORMAT = "%Y/%m/%d %H:%M:%S"
+# Format of the logger's date-time column, always 19 characters
+
+def parse_timestamps(chars):
+    """
+    Vectorized decoder for timestamps in TIMESTAMP_FORMAT.
+
+    Works on the raw bytes of the timestamps, so no Python string is ever created:
+    the digits are checked and combined column by column, and the day of each
+    month is counted with datetime64[M] arithmetic.
+
+    Args:
+        chars: (n, 20) uint8 array, the bytes of each timestamp followed by the byte
+               that ends it (0, a comma or a line break)
+
+    Returns:
+        [times, ok]: int64 ns since the epoch of each timestamp, and a boolean array,
+        False for rows that aren't a valid date in exactly this format (whose time is 0)
+
+    """
+
+    digits = chars[:, [0, 1, 2, 3, 5, 6, 8, 9, 11, 12, 14, 15, 17, 18]].astype(np.int64) - ord("0")
+    ok = np.all((digits >= 0) & (digits <= 9), axis = 1)
+    for i, sep in zip([4, 7, 10, 13, 16], "// ::"):
+        ok &= chars[:, i] == ord(sep)
+    ok &= np.isin(chars[:, 19], [0, ord(","), ord("\r"), ord("\n")])
+
+    year = digits[:, 0] * 1000 + digits[:, 1] * 100 + digits[:, 2] * 10 + digits[:, 3]
+    month, day, hour, minute, second = [digits[:, i] * 10 + digits[:, i + 1] for i in range(4, 14, 2)]
+    ok &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    first_day = months.astype("datetime64[D]").astype(np.int64)
+    ok &= day <= (months + 1).astype("datetime64[D]").astype(np.int64) - first_day
+    # Rejects e.g. February 30th
+
+    seconds = (first_day + day - 1) * 86400 + hour * 3600 + minute * 60 + second
+    return [np.where(ok, seconds * 10**9, 0), ok]
+
+def decode_timestamps(strings):
+    """
+    Converts date-time strings to datetime64[ns], fast for the logger's own format.
+
+    Strings in TIMESTAMP_FORMAT go through parse_timestamps; anything else (other
+    formats, fractional seconds, garbage) falls back to the general pd.to_datetime.
+
+    Args:
+        strings: 1-D array or Series of date-time strings
+
+    Returns:
+        (times, n_fallback): the datetime64[ns] array and the number of rows that
+        needed the general parser
+
+    """
+
+    strings = np.asarray(strings, dtype = object)
+    try:
+        chars = np.asarray(strings, dtype = "S20").view(np.uint8).reshape(len(strings), 20)
+        times, ok = parse_timestamps(chars)
+    except UnicodeEncodeError:
+        # Non-ascii text, which can't be a timestamp of the logger
+        times, ok = np.zeros(len(strings), dtype = np.int64), np.zeros(len(strings), dtype = bool)
+
+    times = times.view("datetime64[ns]")
+    bad = np.flatnonzero(~ok)
+    if len(bad):
+        times[bad] = pd.to_datetime(strings[bad], format = "mixed").to_numpy().astype("datetime64[ns]")
+    return times, len(bad)
+
+def log_timestamps(csv_filepath, block = 1 << 22):
+    """
+    Decodes the date-time column straight from the bytes of a log.
+
+    The logger writes date-time as the first column, so every timestamp sits at the
+    start of a line: the file is scanned for line breaks and the 19 bytes after each
+    one go to parse_timestamps, skipping the csv parser for this column altogether.
+    Rows that aren't in TIMESTAMP_FORMAT go through pd.to_datetime all at once.
+    Quoted timestamps are left to the csv parser, which strips the quotes.
+
+    This pass comes on top of read_csv for the other columns, but costs less time and
+    far less memory than the Python string per row read_csv makes of the column.
+
+    The file is read once into a buffer of its size, and is scanned 'block' bytes and
+    decoded block // 64 rows at a time, so no other temporary grows with the file.
+
+    Args:
+        csv_filepath: Path to an SHT logger csv
+        block: Bytes scanned at a time
+
+    Returns:
+        (times, n_fallback) as for decode_timestamps, with one time per non-blank
+        line after the header, or None if date-time isn't the first column or a line
+        starts with a quote
+
+    """
+
+    size = os.path.getsize(csv_filepath)
+    buf = np.empty(size + 20, dtype = np.uint8)
+    with open(csv_filepath, "rb") as f:
+        size = f.readinto(buf[:size])
+    buf = buf[:size + 20]
+    buf[size:] = ord("\n")
+    # Padding, so the 20 bytes after any line start are in bounds
+
+    header_end = np.argmax(buf[:1 << 16] == ord("\n"))
+    if not bytes(buf[:header_end]).startswith(b"date-time,"):
+        return None
+
+    starts = np.concatenate([np.flatnonzero(buf[i:min(i + block, size)] == ord("\n")) + i + 1\
+                             for i in range(0, size, block)] + [np.zeros(0, dtype = np.int64)])
+    starts = starts[starts < size]
+    starts = starts[(buf[starts] != ord("\n")) & (buf[starts] != ord("\r"))]
+    # Start of every non-blank line after the header
+    if np.any(buf[starts] == ord('"')):
+        return None
+
+    times = np.empty(len(starts), dtype = np.int64)
+    ok = np.empty(len(starts), dtype = bool)
+    rows = max(block // 64, 1)
+    for i in range(0, len(starts), rows):
+        times[i:i + rows], ok[i:i + rows] = parse_timestamps(buf[starts[i:i + rows, None] + np.arange(20)])
+    times = times.view("datetime64[ns]")
+
+    bad = np.flatnonzero(~ok)
+    for i in range(0, len(bad), rows):
+        chars = buf[np.minimum(starts[bad[i:i + rows], None] + np.arange(64), len(buf) - 1)]
+        chars[np.logical_or.accumulate(np.isin(chars, [ord(","), ord("\r"), ord("\n")]), axis = 1)] = 0
+        strings = np.char.strip(np.char.decode(chars.view("S64").ravel(), "ascii", errors = "replace"))
+        times[bad[i:i + rows]] = pd.to_datetime(strings, format = "mixed").to_numpy().astype("datetime64[ns]")
+    # The first field of the rows the fast path can't read, parsed a block at a time
+    # by pd.to_datetime like decode_timestamps does
+    return times, len(bad)
+
+def standardize_datetime(csv_filepath, usecols = None):
+# Read SHT csv log in a single pass and ensure no funky time format survives.
+# Only the columns in 'usecols' are loaded (all of them if None). The number of
+# timestamps that needed the general parser is left in df.attrs["fallback_rows"]
+    usecols, dtypes = read_dtypes(csv_filepath, usecols)
+
+    timestamps = log_timestamps(csv_filepath) if len(usecols) > 1 else None
+    if timestamps is not None:
+        df = pd.read_csv(csv_filepath, usecols = usecols[1:], dtype = dtypes)[usecols[1:]]
+        if len(df) == len(timestamps[0]):
+            df.insert(0, "date-time", timestamps[0])
+            df.attrs["fallback_rows"] = timestamps[1]
+            return df
+        # Lines the csv parser counts differently (e.g. quoted line breaks): read the slow way
+
+    df = pd.read_csv(csv_filepath, usecols = usecols, dtype = dtypes)[usecols]
+    df["date-time"], df.attrs["fallback_rows"] = decode_timestamps(df["date-time"])
     return df
+
+def standardize_datetime_chunks(csv_filepath, usecols = None, chunksize = 10**6):
+# Same as standardize_datetime, but yields the log 'chunksize' rows at a time
+# so it never has to fit in memory at once
+    usecols, dtypes = read_dtypes(csv_filepath, usecols)
+
+    with pd.read_csv(csv_filepath, usecols = usecols, dtype = dtypes, chunksize = chunksize) as reader:
+        for df in reader:
+            df = df[usecols]
+            df["date-time"], df.attrs["fallback_rows"] = decode_timestamps(df["date-time"])
+            yield df
     
 def fit_format(fit_retval):
 # Helper function to format output of warming fit (units / second)
@@ -1,11 +1,86 @@
 import matplotlib.pyplot as plt
-from fit_tools import *
+from .fit_tools import *
 from datetime import datetime as dt 
 from datetime import timedelta
 
+def minmax_decimate(values, n_buckets):
+    """
+    Picks the points to draw of a long series, preserving its shape.
+
+    The series is cut into n_buckets runs of consecutive points (about one per pixel
+    column) and only the first, last, smallest and largest point of each run are kept,
+    so every spike and the full range of the data still show up in the plot.
+
+    Args:
+        values: 1-D array, the series to draw
+        n_buckets: Number of runs to cut it into
+
+    Returns:
+        A sorted 1-D int array of positions in 'values', at most 4 * n_buckets long
+
+    """
+
+    n = len(values)
+    if n <= 4 * n_buckets:
+        return np.arange(n)
+
+    size = -(-n // n_buckets)
+    n_full = n // size * size
+    runs = values[:n_full].reshape(-1, size)
+    offsets = np.arange(0, n_full, size)
+    # Runs of 'size' points; the remaining n - n_full are kept whole
+    keep = np.concatenate((offsets, offsets + size - 1,\
+                           offsets + np.argmin(runs, axis = 1),\
+                           offsets + np.argmax(runs, axis = 1),\
+                           np.arange(n_full, n)))
+    return np.unique(keep)
+
+def fit_axes(n_plots, per_page = 4, name = "Cold period fits"):
+    """
+    Axes for n_plots plots of show_fits, laid out per_page to a figure.
+
+    Figures are looked up by name, so calling this again clears and reuses the
+    windows of the previous call instead of opening new ones; pages that are no
+    longer needed are closed.
+
+    Args:
+        n_plots: Number of plots
+        per_page: Plots per figure, in 2 columns unless it is 1
+        name: Title of the figures, numbered if there are several pages
+
+    Returns:
+        A list of n_plots axes
+
+    """
+
+    plt.style.use("dark_background")
+    n_pages = -(-n_plots // per_page)
+    ncols = 1 if per_page == 1 else 2
+    nrows = -(-per_page // ncols)
+
+    axes = []
+    labels = []
+    for page in range(n_pages):
+        labels.append(name if n_pages == 1 else "%s (%d of %d)" % (name, page + 1, n_pages))
+        fig = plt.figure(num = labels[-1], figsize = (12, 8), clear = True)
+        page_axes = fig.subplots(nrows, ncols, squeeze = False).ravel()
+        n = min(per_page, n_plots - page * per_page)
+        for ax in page_axes[n:]:
+            ax.remove()
+        axes += list(page_axes[:n])
+        fig.set_layout_engine("tight")
+
+    for label in plt.get_figlabels():
+        if label.startswith(name) and label not in labels:
+            plt.close(label)
+    # Pages left over from a previous call with more plots
+
+    return axes
+
 def show_fits(dt_data, mask, data, col, with_fit, t_data, slope,\
-              intercept, chi_sq, DOF, start_time, end_time, data_label):
-"""
+              intercept, chi_sq, DOF, start_time, end_time, data_label,\
+              ax = None, max_points = None, fontsize = 20, segments = None):
+    """
     Displays data from a cold period with fit line to quantify warming trend. 
     
     This function is passed a mask for cold period data and fit information to plot the warming trend.
@@ -13,7 +88,7 @@ def show_fits(dt_data, mask, data, col, with_fit, t_data, slope,\
 
     Args:
         dt_data: A 1-D datetime array
-        mask: Boolean array indicating where we were cold
+        mask: Index into dt_data (slice, positions or boolean array) selecting the plotted data
         data: 1-D array of the quantity we are tracking (temperature, pressure)
         col: String, column label in the output of the SHT logger
         with_fit: bool, True indicating to plot the fit line, False, otherwise
@@ -26,36 +101,63 @@ def show_fits(dt_data, mask, data, col, with_fit, t_data, slope,\
         start_time: Datetime corresponding to the start of the cold period 
         end_time: Datetime corresponding to the end of the cold period 
         data_label: String, whatever we want to label the data as in the plot. Unlike col, it has no indexing use.
+        ax: The axes to draw in (e.g. from fit_axes), a new 12x8 figure if None
+        max_points: If set, only about this many points are drawn, chosen by
+                    minmax_decimate. The fit itself always uses all the data.
+        fontsize: Size of the title and axis label; the rest scales with it
+        segments: Optional list of (first, stop, slope, intercept) of the segments of
+                  the data (see segment_windows), each drawn as its own fit line over
+                  data[first:stop]
     Returns:
         None
     
-"""
+    """
     s_per_day = 86400
     
-    plt.style.use("dark_background")
-    
-    fig, ax = plt.subplots(figsize = (12,8))
+    if ax is None:
+        plt.style.use("dark_background")
+        fig, ax = plt.subplots(figsize = (12,8))
+
+    dates = dt_data.to_numpy()[mask]
+    if segments:
+        ends = np.array([[first, stop - 1] for first, stop, _, _ in segments], dtype = int)
+        segment_dates = dates[ends]
+        segment_values = [lin_fit(t_data[e], slope, intercept) for e, (_, _, slope, intercept)\
+                          in zip(ends, segments)]
+        # Straight lines, so only the ends of each segment are needed
+    if max_points is not None:
+        shown = minmax_decimate(data, max_points // 4)
+        dates, data, t_data = dates[shown], data[shown], t_data[shown]
+        # Draws a few points per pixel column; the fit line is straight, so nothing is lost
                         
-    ax.plot(dt_data.loc[mask], data, "white", label = col[:col.find("(")]\
+    ax.plot(dates, data, "white", label = col[:col.find("(")]\
                     if "(" in col else col)
     
     if with_fit:
-        ax.plot(dt_data.loc[mask], lin_fit(t_data, slope, intercept), "r",\
+        ax.plot(dates, lin_fit(t_data, slope, intercept), "r",\
                 label = "Warming rate: %.3f K/day,\n $\chi^2$ = %.2f, ndof = %d"\
                 % (slope * s_per_day, chi_sq, DOF))
+
+    if segments:
+        for i, (seg_dates, seg_values) in enumerate(zip(segment_dates, segment_values)):
+            ax.plot(seg_dates, seg_values, "cyan", linewidth = 2,\
+                    label = "Segments: %s K/day" % ", ".join("%.3f" % (s[2] * s_per_day) for s in segments)\
+                    if i == 0 else None)
+            if i > 0:
+                ax.axvline(seg_dates[0], color = "cyan", alpha = 0.3, linestyle = ":")
     
     ax.tick_params(axis = "x", labelsize = 8, rotation = 45)
-    ax.tick_params(axis = "y", labelsize = 18)
+    ax.tick_params(axis = "y", labelsize = fontsize * 0.9)
     
-    ax.set_ylabel("%s" % data_label, fontsize = 20)
+    ax.set_ylabel("%s" % data_label, fontsize = fontsize)
     
     ax.set_title("%s between %s and %s" % (col[:col.find("(")]\
                     if "(" in col else col, str(start_time)[:10],\
-                    str(end_time)[:10]), fontsize = 20)
-    ax.legend(fontsize = 15)
+                    str(end_time)[:10]), fontsize = fontsize)
+    ax.legend(fontsize = fontsize * 0.75)
 
-def show_warming_trends(datetimes, slopes, errs, dates, col):
-"""
+def show_warming_trends(table, col):
+    """
     Displays warming rates from many cold periods over months/years of operation.
     
     This function is passed a number of different warming rates, generated elsewhere, to 
@@ -63,28 +165,38 @@ def show_warming_trends(datetimes, slopes, errs, dates, col):
     the mask was on the target for reference. 
 
     Args:
-        datetimes: A 1-D datetime array
-        slopes: The warming rates in K/day
-        errs: The errors on those warming rates
-        dates: Dates for the cold periods, in colloquial format
+        table: A results table (see results_table), e.g. from analyze_files. Each
+               rate is drawn at the midpoint of its period, with its bootstrap
+               interval as error bar where there is one, else slope_err.
         col: String, column label in the output of the SHT logger
         
     Returns:
         None
     
-"""
+    """
     
     plt.style.use("dark_background")
     s_per_day = 86400
 
+    table = table.dropna(subset = ["slope"])
+    datetimes = list(table["midpoint"])
+    slopes = table["slope"].to_numpy()
+    dates = [t.strftime("%d %B %Y") for t in datetimes]
+
     fig, ax = plt.subplots(figsize = (12,8))
 
-    ax.errorbar(datetimes, slopes * s_per_day, fmt = "ro", yerr = errs * s_per_day,\
+    yerr = np.tile(table["slope_err"].to_numpy(), (2, 1))
+    intervals = table[["slope_lo", "slope_hi"]].to_numpy()
+    finite = np.isfinite(intervals).all(axis = 1)
+    yerr[:, finite] = np.abs(intervals[finite].T - slopes[finite])
+    # Asymmetric bars from the lower and upper end of each bootstrap interval
+
+    ax.errorbar(datetimes, slopes * s_per_day, fmt = "ro", yerr = yerr * s_per_day,\
                 capsize = 5, elinewidth = 0.5)
     
     [ax.annotate(dates[j], (datetimes[j] - timedelta(days = 100),\
                  slopes[j] * s_per_day - 1e-3 * (-1)**(2*j + 1)),\
-                 color = "lime" if datetimes[j] == np.max(datetimes)\
+                 color = "lime" if datetimes[j] == max(datetimes)\
                  else "white") for j in range(len(slopes))]
     
     ax.axvspan(dt(2020, 11, 13, 0, 0), dt(2021, 5, 13, 0, 0),\
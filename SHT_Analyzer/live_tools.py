@@ -0,0 +1,191 @@
+import os
+import io
+import numpy as np
+import pandas as pd
+from .data_tools import BinnedData
+from .format_tools import decode_timestamps
+
+
+
+class LiveBinner:
+    """
+    Incrementally bins an SHT log that the logger is still appending to.
+
+    Every call to poll() only reads and parses the bytes written since the previous
+    call. Finished bins are stored as means in preallocated column buffers, and the
+    bin currently being filled keeps running sums and counts. Its mean is written
+    into the slot right after the finished bins, so view() can hand out the binned
+    data (open bin included) as zero-copy views.
+
+    Bins are aligned on multiples of n_minutes since midnight of the day of the first
+    row, like bin_by_minute, and a bin missing data in any column is left out, as its dropna() does.
+    The logger writes rows in time order; rows older than the open bin are ignored.
+
+    A log that is truncated or replaced (another file, or one starting with other
+    lines) is read again from the top; 'resets' counts how many times that happened.
+    """
+
+    def __init__(self, filepath, columns = None, n_minutes = 10):
+        self.filepath = filepath
+        self.requested = columns
+        self.bin_width = np.int64(n_minutes * 60 * 10**9)
+        # Bin width in ns
+        self.resets = 0
+        self.reset()
+
+    def reset(self):
+        # Forgets everything read so far, e.g. when the log was truncated or replaced
+        self.offset = 0
+        self.identity = None
+        # (device, inode) of the file read so far
+        self.head = b""
+        # Its first bytes, up to the end of the first row
+        self.names = None
+        self.origin = None
+        # Midnight of the first row in ns, where the bin edges start
+        self.columns = []
+        self.n_bins = 0
+        self.times = np.empty(0, dtype = np.int64)
+        self.values = np.empty((0, 0))
+        self.open_bin = None
+        self.open_sum = None
+        self.open_count = None
+
+    def poll(self):
+        """
+        Reads the complete lines appended to the log since the last poll and bins them.
+
+        Returns:
+            The number of new rows
+        """
+
+        with open(self.filepath, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if self.replaced(f, stat):
+                self.reset()
+                self.resets += 1
+            self.identity = (stat.st_dev, stat.st_ino)
+            f.seek(self.offset)
+            chunk = f.read()
+
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return 0
+        chunk = chunk[:end]
+        self.offset += end
+        # A partially written last line is left for the next poll
+
+        if self.head.count(b"\n") < 2:
+            lines = (self.head + chunk).split(b"\n", 2)
+            self.head = b"\n".join(lines[:2]) + (b"\n" if len(lines) > 2 else b"")
+            # The head always ends a line, so it is everything read until it has a row
+
+        if self.names is None:
+            header, _, chunk = chunk.partition(b"\n")
+            self.set_columns(list(pd.read_csv(io.BytesIO(header), nrows = 0).columns))
+        if not chunk.strip():
+            return 0
+
+        dtypes = {col: np.float64 for col in self.columns}
+        dtypes["date-time"] = str
+        df = pd.read_csv(io.BytesIO(chunk), header = None, names = self.names,\
+                         usecols = ["date-time"] + self.columns, dtype = dtypes)
+
+        times, _ = decode_timestamps(df["date-time"])
+        self.add_rows(times.view(np.int64), df[self.columns].to_numpy(np.float64))
+
+        return len(df)
+
+    def replaced(self, f, stat):
+        # True if the open file 'f' (stat 'stat') isn't the log read so far any more:
+        # another file, shorter than what was read, or not starting with the same bytes
+        if self.identity is None:
+            return False
+        if (stat.st_dev, stat.st_ino) != self.identity or stat.st_size < self.offset:
+            return True
+        f.seek(0)
+        return f.read(len(self.head)) != self.head
+
+    def set_columns(self, names):
+        # Sets up the buffers once the header of the log is known
+        self.names = names
+        requested = names if self.requested is None else self.requested
+        self.columns = [col for col in dict.fromkeys(requested) if col != "date-time"]
+        self.values = np.empty((len(self.columns), 0))
+        self.open_sum = np.zeros(len(self.columns))
+        self.open_count = np.zeros(len(self.columns), dtype = np.int64)
+
+    def add_rows(self, times, values):
+        # Folds time-ordered rows into the open bin, closing it and opening new ones as needed
+        if self.origin is None:
+            day = np.int64(24 * 3600 * 10**9)
+            self.origin = times[0] - times[0] % day
+        keys = times - (times - self.origin) % self.bin_width
+        if self.open_bin is not None:
+            keep = keys >= self.open_bin
+            keys, values = keys[keep], values[keep]
+        if len(keys) == 0:
+            return
+
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+        bin_keys = keys[starts]
+        valid = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(valid, values, 0.), starts, axis = 0)
+        counts = np.add.reduceat(valid.astype(np.int64), starts, axis = 0)
+        # Sum and number of non-NaN values of each column in each new bin
+
+        if self.open_bin is not None and bin_keys[0] == self.open_bin:
+            sums[0] += self.open_sum
+            counts[0] += self.open_count
+        elif self.open_bin is not None:
+            self.close_bins(np.array([self.open_bin]), self.open_sum[None], self.open_count[None])
+
+        self.close_bins(bin_keys[:-1], sums[:-1], counts[:-1])
+        self.open_bin, self.open_sum, self.open_count = bin_keys[-1], sums[-1], counts[-1]
+        self.write_open_bin()
+
+    def close_bins(self, bin_keys, sums, counts):
+        # Appends the means of finished bins to the buffers
+        full = np.all(counts > 0, axis = 1)
+        bin_keys, sums, counts = bin_keys[full], sums[full], counts[full]
+        n_new = len(bin_keys)
+
+        if self.n_bins + n_new + 1 > len(self.times):
+            capacity = max(2 * len(self.times), self.n_bins + n_new + 1, 1024)
+            times = np.empty(capacity, dtype = np.int64)
+            values = np.empty((len(self.columns), capacity))
+            times[:self.n_bins] = self.times[:self.n_bins]
+            values[:, :self.n_bins] = self.values[:, :self.n_bins]
+            self.times, self.values = times, values
+            # Doubling keeps the cost of growing the buffers amortized O(1) per bin
+
+        self.times[self.n_bins:self.n_bins + n_new] = bin_keys
+        self.values[:, self.n_bins:self.n_bins + n_new] = (sums / counts).T
+        self.n_bins += n_new
+
+    def write_open_bin(self):
+        # Updates the mean of the open bin in the slot after the finished bins,
+        # which close_bins always leaves room for
+        self.times[self.n_bins] = self.open_bin
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            self.values[:, self.n_bins] = self.open_sum / self.open_count
+
+    def n_visible(self):
+        # Finished bins, plus the open bin if every column has data in it
+        has_open = self.open_bin is not None and np.all(self.open_count > 0)
+        return self.n_bins + int(has_open)
+
+    def view(self):
+        """
+        The binned data so far, in the format of bin_by_minute.
+
+        Returns:
+            A BinnedData whose arrays are views of the buffers (valid until the next poll)
+        """
+
+        n = self.n_visible()
+        return BinnedData(self.times[:n], {col: self.values[j, :n] for j, col in enumerate(self.columns)})
+
+    def closed(self, since):
+        # Times and values of the finished bins from index 'since' onwards
+        return self.times[since:self.n_bins], self.values[:, since:self.n_bins]
@@ -0,0 +1,173 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from .analyzer import SHT_Analyzer
+
+
+
+class Prefetcher:
+    """
+    Loads the logs of a folder into SHT_Analyzers in the background, ahead of being asked for.
+
+    Worker threads take files from a queue, newest first unless one is promoted (e.g.
+    the file just clicked), and keep the loaded analyzers in a bounded in-memory cache,
+    least recently used dropped first. Only as many files as fit in the cache are
+    prefetched, so browsing a large folder never loads a file just to evict it. Loading
+    goes through the binned data cache as usual, so even evicted files reopen quickly.
+
+    Every file is loaded with the sensor columns of self.columns (see want). Adding a
+    column to files already loaded works on a copy of their analyzer, swapped in once
+    it is done, so an analyzer handed out is never changed by the workers.
+    """
+
+    def __init__(self, max_files = 8, n_workers = 1, columns = (), **kwargs):
+        self.max_files = max_files
+        # Analyzers kept in memory
+        self.columns = list(columns)
+        # Columns loaded with every file, besides those of the cold conditions
+        self.kwargs = kwargs
+        # Other keyword arguments of SHT_Analyzer for every file
+        self.analyzers = OrderedDict()
+        self.queue = deque()
+        self.loading = {}
+        # Path -> Event set once its analyzer is loaded (or failed to)
+        self.errors = {}
+        # Path -> exception of the last failed load
+        self.condition = threading.Condition()
+        self.closed = False
+        self.workers = [threading.Thread(target = self.work, daemon = True) for _ in range(n_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def ready(self, filepath):
+        # True if 'filepath' is loaded with every column of self.columns
+        sa = self.analyzers.get(filepath)
+        return sa is not None and all(col in sa.binned for col in self.columns)
+
+    def want(self, columns):
+        # Loads 'columns' too from now on, adding them to the files already loaded
+        with self.condition:
+            self.columns = list(columns)
+            self.queue.extend(f for f in reversed(self.analyzers)\
+                              if not self.ready(f) and f not in self.queue)
+            # Most recently used first
+            self.condition.notify_all()
+
+    def prefetch(self, filepaths, first = None):
+        # Replaces the queue with 'filepaths', newest first ('first' before them all);
+        # files already loaded (with every column) or loading aren't queued again
+        filepaths = sorted(filepaths, key = lambda f: os.path.getmtime(f) if os.path.exists(f) else 0,\
+                           reverse = True)
+        if first is not None and first in filepaths:
+            filepaths.remove(first)
+            filepaths.insert(0, first)
+        with self.condition:
+            self.queue = deque(f for f in filepaths[:self.max_files]\
+                               if not self.ready(f) and f not in self.loading)
+            self.condition.notify_all()
+
+    def promote(self, filepath):
+        # Loads 'filepath' next, ahead of everything queued
+        with self.condition:
+            if self.ready(filepath) or filepath in self.loading:
+                return
+            if filepath in self.queue:
+                self.queue.remove(filepath)
+            self.queue.appendleft(filepath)
+            self.condition.notify()
+
+    def peek(self, filepath):
+        # The loaded analyzer of 'filepath', None if it isn't loaded (yet)
+        with self.condition:
+            sa = self.analyzers.get(filepath)
+            if sa is not None:
+                self.analyzers.move_to_end(filepath)
+            return sa
+
+    def get(self, filepath):
+        """
+        The analyzer of 'filepath', waiting for it if it is loading and loading it now if not.
+
+        Args:
+            filepath: Path to an SHT logger csv
+
+        Returns:
+            An SHT_Analyzer, the same object for as long as it stays cached
+
+        """
+
+        with self.condition:
+            if filepath in self.analyzers:
+                self.analyzers.move_to_end(filepath)
+                return self.analyzers[filepath]
+            done = self.loading.get(filepath)
+            if done is None:
+                if filepath in self.queue:
+                    self.queue.remove(filepath)
+                done = self.loading[filepath] = threading.Event()
+                self.errors.pop(filepath, None)
+                owner = True
+            else:
+                owner = False
+
+        if owner:
+            self.load(filepath, done)
+        else:
+            done.wait()
+
+        with self.condition:
+            if filepath in self.errors:
+                raise self.errors[filepath]
+            return self.analyzers[filepath]
+
+    def load(self, filepath, done, sa = None):
+        # Loads 'filepath' (or the columns 'sa' lacks, on a copy of it) in the calling thread
+        # and caches it; 'done' is set either way
+        columns = self.columns
+        try:
+            if sa is None:
+                sa = SHT_Analyzer(filepath, columns = columns, **self.kwargs)
+            else:
+                sa = sa.copy()
+                sa.load_columns(columns)
+        except Exception as e:
+            with self.condition:
+                self.errors[filepath] = e
+        else:
+            with self.condition:
+                self.analyzers[filepath] = sa
+                while len(self.analyzers) > self.max_files:
+                    self.analyzers.popitem(last = False)
+        finally:
+            with self.condition:
+                del self.loading[filepath]
+            done.set()
+
+    def work(self):
+        # Worker thread: loads queued files until closed
+        while True:
+            with self.condition:
+                while not self.queue and not self.closed:
+                    self.condition.wait()
+                if self.closed:
+                    return
+                filepath = self.queue.popleft()
+                if self.ready(filepath) or filepath in self.loading:
+                    continue
+                done = self.loading[filepath] = threading.Event()
+                sa = self.analyzers.get(filepath)
+            self.load(filepath, done, sa)
+            # A failure is kept for get() to raise, which then tries again on the next call
+
+    def clear(self):
+        # Forgets every loaded analyzer and queued file
+        with self.condition:
+            self.queue.clear()
+            self.analyzers.clear()
+
+    def close(self):
+        # Stops the workers once they finish the file they are loading
+        with self.condition:
+            self.closed = True
+            self.queue.clear()
+            self.condition.notify_all()
@@ -0,0 +1,260 @@
+import numpy as np
+import pandas as pd
+from .data_tools import BinnedData
+
+
+
+LEVELS = (1, 10, 60, 1440)
+# Bin widths in minutes of the levels of a pyramid, each a multiple of the one before
+
+AGG_DTYPE = np.dtype([("sum", np.float64), ("count", np.int64), ("min", np.float64),\
+                      ("max", np.float64), ("sumsq", np.float64)])
+# Aggregates of the non-NaN values of one column in one bin. Any coarser bin is
+# aggregated exactly from them, and they give the mean, spread and envelope of the bin
+
+MINUTE = 60 * 10**9
+# ns
+
+
+def aggregate_rows(keys, values):
+    """
+    Aggregates rows sharing a bin.
+
+    Args:
+        keys: int64 bin of each row, sorted
+        values: 1-D float array, one value per row; NaNs are left out of every aggregate
+
+    Returns:
+        [bins, aggs]: the distinct keys and an AGG_DTYPE array, one record per bin
+
+    """
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype = np.int64)
+    present = ~np.isnan(values)
+
+    aggs = np.zeros(len(starts), dtype = AGG_DTYPE)
+    if len(starts):
+        aggs["sum"] = np.add.reduceat(np.where(present, values, 0.), starts)
+        aggs["count"] = np.add.reduceat(present.astype(np.int64), starts)
+        aggs["min"] = np.minimum.reduceat(np.where(present, values, np.inf), starts)
+        aggs["max"] = np.maximum.reduceat(np.where(present, values, -np.inf), starts)
+        aggs["sumsq"] = np.add.reduceat(np.where(present, values * values, 0.), starts)
+    return [keys[starts], aggs]
+
+def combine_aggregates(keys, aggs):
+    """
+    Merges aggregates sharing a bin into one record per bin.
+
+    Args:
+        keys: int64 bin of each record, sorted
+        aggs: AGG_DTYPE array, one record per key
+
+    Returns:
+        [bins, aggs] as for aggregate_rows
+
+    """
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype = np.int64)
+    if len(starts) == len(keys):
+        return [keys, aggs]
+
+    combined = np.zeros(len(starts), dtype = AGG_DTYPE)
+    for field, ufunc in [("sum", np.add), ("count", np.add), ("min", np.minimum),\
+                         ("max", np.maximum), ("sumsq", np.add)]:
+        combined[field] = ufunc.reduceat(aggs[field], starts)
+    return [keys[starts], combined]
+
+def agg_mean(aggs):
+# Mean of each bin, NaN where it has no values
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.where(aggs["count"] > 0, aggs["sum"] / aggs["count"], np.nan)
+
+def agg_std(aggs):
+# Standard deviation of the values of each bin, NaN where it has none
+    mean = agg_mean(aggs)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.sqrt(np.maximum(aggs["sumsq"] / aggs["count"] - mean * mean, 0.))
+
+
+class AggregatePyramid:
+    """
+    Per-bin aggregates of a log at several resolutions, for re-binning without the raw data.
+
+    Each level holds, for every bin of its width and every column, the sum, count,
+    min, max and sum of squares of the values in the bin (AGG_DTYPE). Bins are aligned
+    on multiples of their width from midnight of the first day, like bin_by_minute, so
+    a bin of any multiple of a level's width is aggregated exactly from that level.
+    Requests are served from the coarsest level that fits, so re-binning months of
+    data at 1 h touches 60 times fewer records than going back to the minutes.
+    """
+
+    def __init__(self, origin, levels, times, columns):
+        self.origin = origin
+        # int64 ns, midnight of the first day of the log
+        self.levels = tuple(levels)
+        self.times = times
+        # Start of each bin, one int64 array per level
+        self.columns = columns
+        # Column name -> one AGG_DTYPE array per level
+
+    @classmethod
+    def from_chunks(cls, chunks, columns = None, levels = LEVELS):
+        """
+        Builds a pyramid from rows arriving in chunks.
+
+        Only one chunk of rows is held at a time; each is reduced to the finest level
+        right away and the coarser levels are then built from the finest one.
+
+        Args:
+            chunks: An iterable of dataframes in the format of standardize_datetime,
+                    e.g. from standardize_datetime_chunks or Archive.chunks
+            columns: Columns to aggregate, every sensor column of the first chunk if None
+            levels: Bin widths in minutes, ascending, each a multiple of the one before
+
+        Returns:
+            An AggregatePyramid
+
+        """
+
+        if any(coarse % fine for fine, coarse in zip(levels, levels[1:])):
+            raise ValueError("Each level must be a multiple of the one before, got %s" % (levels,))
+
+        width = levels[0] * MINUTE
+        origin = None
+        keys, aggs = [], {}
+
+        for df in chunks:
+            if len(df) == 0:
+                continue
+            times = df["date-time"].to_numpy().astype("datetime64[ns]", copy = False).view(np.int64)
+            if origin is None:
+                origin = times[0] - times[0] % (1440 * MINUTE)
+                columns = [col for col in df.columns if col != "date-time"] if columns is None\
+                          else [col for col in columns if col != "date-time"]
+                if not columns:
+                    raise ValueError("No columns to aggregate")
+            order = None if np.all(times[1:] >= times[:-1]) else np.argsort(times, kind = "stable")
+            chunk_keys = origin + (times - origin) // width * width
+            chunk_keys = chunk_keys if order is None else chunk_keys[order]
+
+            for col in columns:
+                values = df[col].to_numpy(dtype = np.float64)
+                bins, col_aggs = aggregate_rows(chunk_keys, values if order is None else values[order])
+                aggs.setdefault(col, []).append(col_aggs)
+            keys.append(bins)
+
+        if origin is None:
+            raise ValueError("No rows to aggregate")
+
+        keys = np.concatenate(keys)
+        order = None if np.all(keys[1:] >= keys[:-1]) else np.argsort(keys, kind = "stable")
+        # Chunks overlap only at their edges unless the log wasn't in time order
+        all_times, all_columns = [], {}
+        for col, parts in aggs.items():
+            col_aggs = np.concatenate(parts)
+            bins, col_aggs = combine_aggregates(keys if order is None else keys[order],\
+                                                col_aggs if order is None else col_aggs[order])
+            levels_aggs = [col_aggs]
+            level_times = [bins]
+            for n_minutes in levels[1:]:
+                coarse_width = n_minutes * MINUTE
+                bins, col_aggs = combine_aggregates(origin + (bins - origin) // coarse_width * coarse_width,\
+                                                    col_aggs)
+                levels_aggs.append(col_aggs)
+                level_times.append(bins)
+            all_columns[col] = levels_aggs
+            all_times = level_times
+            # Every column has the same bins, one per bin holding any row
+
+        return cls(origin, levels, all_times, all_columns)
+
+    @classmethod
+    def load(cls, path):
+        # Reads a pyramid written by save
+        with np.load(path, allow_pickle = False) as entry:
+            levels = tuple(entry["levels"].tolist())
+            names = entry["names"].tolist()
+            times = [entry["times_%d" % j] for j in range(len(levels))]
+            columns = {name: [entry["col_%d_%d" % (i, j)] for j in range(len(levels))]\
+                       for i, name in enumerate(names)}
+            return cls(int(entry["origin"]), levels, times, columns)
+
+    def save(self, path):
+        # Writes the pyramid as an uncompressed npz, see load
+        arrays = {"times_%d" % j: times for j, times in enumerate(self.times)}
+        arrays.update({"col_%d_%d" % (i, j): aggs for i, levels in enumerate(self.columns.values())\
+                       for j, aggs in enumerate(levels)})
+        with open(path, "wb") as f:
+            np.savez(f, origin = self.origin, levels = np.array(self.levels),\
+                     names = np.array(self.names(), dtype = str), **arrays)
+
+    def names(self):
+        return list(self.columns)
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    def level(self, n_minutes):
+        # Index of the coarsest level whose bins tile bins of n_minutes
+        fits = [j for j, width in enumerate(self.levels) if n_minutes % width == 0]
+        if not fits:
+            raise ValueError("%s min bins can't be built from levels of %s min" % (n_minutes, self.levels))
+        return fits[-1]
+
+    def aggregate(self, n_minutes, columns = None, start = None, end = None):
+        """
+        The aggregates of bins of width n_minutes, from the coarsest level that fits.
+
+        Args:
+            n_minutes: Width of the bins, a multiple of the finest level
+            columns: Columns to aggregate, all of them if None
+            start: Datetime from which bins are kept, None for the first one
+            end: Datetime up to which bins are kept, None for the last one
+
+        Returns:
+            [times, aggs]: the start of each bin (int64 ns) and a dict of one AGG_DTYPE
+            array per column
+
+        """
+
+        j = self.level(n_minutes)
+        columns = self.names() if columns is None else list(columns)
+        missing = [col for col in columns if col not in self.columns]
+        if missing:
+            raise KeyError("%s not in the pyramid" % ", ".join(missing))
+
+        times = self.times[j]
+        window = slice(0 if start is None else np.searchsorted(times, pd.Timestamp(start).as_unit("ns").value),\
+                       len(times) if end is None else\
+                       np.searchsorted(times, pd.Timestamp(end).as_unit("ns").value, side = "right"))
+        times = times[window]
+
+        width = n_minutes * MINUTE
+        keys = self.origin + (times - self.origin) // width * width
+        bins = keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) else keys
+        aggs = {col: combine_aggregates(keys, self.columns[col][j][window])[1] for col in columns}
+        return [bins, aggs]
+
+    def binned(self, n_minutes, columns = None, start = None, end = None, dtype = np.float64):
+        # Means of bins of n_minutes as BinnedData, like bin_by_minute: bins where any of
+        # 'columns' has no data are dropped
+        times, aggs = self.aggregate(n_minutes, columns, start, end)
+        keep = np.ones(len(times), dtype = bool)
+        for col_aggs in aggs.values():
+            keep &= col_aggs["count"] > 0
+        return BinnedData(times[keep], {col: agg_mean(col_aggs[keep]).astype(dtype)\
+                                        for col, col_aggs in aggs.items()})
+
+    def envelope(self, col, n_minutes, start = None, end = None):
+        # Mean, standard deviation, min, max and count of one column in bins of n_minutes,
+        # as a DataFrame; the min / max show spikes that the mean smooths away
+        times, aggs = self.aggregate(n_minutes, [col], start, end)
+        aggs = aggs[col]
+        return pd.DataFrame({"date-time": times.view("datetime64[ns]"), "mean": agg_mean(aggs),\
+                             "std": agg_std(aggs), "min": np.where(aggs["count"] > 0, aggs["min"], np.nan),\
+                             "max": np.where(aggs["count"] > 0, aggs["max"], np.nan),\
+                             "count": aggs["count"]})
+
+    def nbytes(self):
+        return sum(times.nbytes for times in self.times)\
+               + sum(aggs.nbytes for levels in self.columns.values() for aggs in levels)
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+
+COLD_CONDITIONS = {"PtCo1(K)": (4.5, 4.5)}
+# (enter, exit) thresholds in K per sensor: the target is cold once every sensor
+# reads below its enter threshold and warm again once any reads at or above its exit one
+
+MIN_DWELL = np.timedelta64(20, "m")
+# Shortest stay in a state; shorter excursions are random spikes and ignored
+
+
+class ColdDetector:
+    """
+    Finds the cold periods of binned data in one pass, incrementally as bins arrive.
+
+    Each bin is marked entering (every sensor below its enter threshold), leaving (any
+    sensor at or above its exit threshold) or neither, and the state is carried forward
+    through the 'neither' bins with an accumulated maximum, so values between the two
+    thresholds (hysteresis) or missing values never flip it. An edge is the last bin
+    before the state changes; a stay shorter than min_dwell drops both of its edges,
+    merging it into the surrounding state. The state, the time of the last bin and the
+    edges are all that is kept, so appended bins only cost their own length.
+    """
+
+    def __init__(self, conditions = None, min_dwell = MIN_DWELL):
+        self.conditions = dict(COLD_CONDITIONS if conditions is None else conditions)
+        for col, (enter, leave) in self.conditions.items():
+            if leave < enter:
+                raise ValueError("%s: the exit threshold %s is below the enter threshold %s" % (col, leave, enter))
+        self.min_dwell = np.int64(np.timedelta64(min_dwell, "ns").astype(np.int64))
+        self.cold = None
+        self.last_time = None
+        self.edges = []
+
+    def columns(self):
+        # Sensor columns the detector reads
+        return list(self.conditions)
+
+    def update(self, times, columns):
+        """
+        Consumes newly finished bins.
+
+        Args:
+            times: int64 ns (or datetime64) time of each bin, after any bin seen so far
+            columns: Dict of the values of each sensor of self.conditions, one per bin
+
+        Returns:
+            None
+
+        """
+
+        times = np.asarray(times).astype("datetime64[ns]").view(np.int64)
+        if len(times) == 0:
+            return
+
+        enter = np.ones(len(times), dtype = bool)
+        leave = np.zeros(len(times), dtype = bool)
+        for col, (enter_below, leave_at) in self.conditions.items():
+            values = np.asarray(columns[col])
+            enter &= values < enter_below
+            leave |= values >= leave_at
+        # NaN is neither; with exit >= enter no bin can be both
+
+        signal = np.where(enter, 1, np.where(leave, -1, 0))
+        if self.cold is not None:
+            signal = np.concatenate(([1 if self.cold else -1], signal))
+            times = np.concatenate(([self.last_time], times))
+        last = np.maximum.accumulate(np.where(signal != 0, np.arange(len(signal)), 0))
+        cond = signal[last] > 0
+        # State of each bin: that of the last bin entering or leaving, warm before any
+
+        if self.cold is None and cond[0]:
+            self.edges.append(times[0])
+            # Data starts cold
+
+        for edge in times[np.flatnonzero(np.diff(cond))]:
+            if self.edges and edge - self.edges[-1] < self.min_dwell:
+                self.edges.pop()
+                # Too short a stay: its start is undone and this edge is not one either
+            else:
+                self.edges.append(edge)
+        self.cold, self.last_time = bool(cond[-1]), times[-1]
+
+    def intervals(self):
+        """
+        Cold periods found so far, in the format of find_cold_ranges.
+
+        A period that is still cold ends, for now, at the last bin seen.
+
+        Returns:
+            An (n, 2) array of datetimes bookending each cold period
+        """
+
+        edges = np.array(self.edges, dtype = np.int64)
+        if len(edges) % 2:
+            edges = np.append(edges, self.last_time)
+        return edges.view("datetime64[ns]").reshape(-1, 2)
@@ -0,0 +1,157 @@
+import csv
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+
+_traces = []
+# [start_bytes, peak_bytes] of every stage tracing memory right now, in any thread
+_traces_lock = threading.Lock()
+
+
+def start_trace():
+# Starts tracing memory for a stage, tracemalloc itself only if no stage is tracing yet.
+# Returns the stage's [start_bytes, peak_bytes], None if tracemalloc is in use elsewhere
+# (whose peak isn't reset under it)
+    with _traces_lock:
+        if not _traces:
+            if tracemalloc.is_tracing():
+                return None
+            tracemalloc.start()
+        current, peak = tracemalloc.get_traced_memory()
+        for trace in _traces:
+            trace[1] = max(trace[1], peak)
+        # Stages still running keep the peak the reset below clears
+        tracemalloc.reset_peak()
+        trace = [current, current]
+        _traces.append(trace)
+        return trace
+
+def stop_trace(trace):
+# Ends the trace of start_trace, stopping tracemalloc after the last stage tracing.
+# Returns the peak bytes allocated during the stage
+    with _traces_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        for other in _traces:
+            other[1] = max(other[1], peak)
+        del _traces[next(i for i, other in enumerate(_traces) if other is trace)]
+        if not _traces:
+            tracemalloc.stop()
+        return trace[1] - trace[0]
+
+
+class StageStats:
+    """
+    Opt-in timing and memory instrumentation for the stages of an analysis.
+
+    Each stage run inside stage() adds one record with its wall time, the number of
+    rows it processed and, if trace_memory is set, the peak memory allocated while
+    it ran (through tracemalloc, which itself slows allocations down, so it only runs
+    while a stage is, and not at all if something else is using it). A disabled
+    StageStats records nothing and costs next to nothing, so analysis code can
+    always go through stage().
+
+    'hook' attaches an external profiler: it is called with the name of each stage
+    and must return a context manager, which is entered for the duration of the stage.
+    For instance, with a cProfile.Profile named profiler:
+
+        @contextmanager
+        def profile(name):
+            profiler.enable()
+            yield
+            profiler.disable()
+
+        sa = SHT_Analyzer(filepath, stats = StageStats(hook = profile))
+    """
+
+    FIELDS = ["source", "stage", "seconds", "rows", "peak_bytes"]
+
+    def __init__(self, enabled = True, trace_memory = True, hook = None):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.hook = hook
+        self.records = []
+
+    @contextmanager
+    def stage(self, name, rows = None, source = None):
+        """
+        Times the code run inside the with block as stage 'name'.
+
+        The record is yielded, so rows can be filled in once they are known:
+
+            with stats.stage("parse") as record:
+                df = standardize_datetime(filepath)
+                record["rows"] = len(df)
+        """
+
+        record = {"source": source, "stage": name, "seconds": None, "rows": rows,\
+                  "peak_bytes": None}
+        if not self.enabled:
+            yield record
+            return
+
+        trace = start_trace() if self.trace_memory else None
+        start = time.perf_counter()
+        try:
+            with (self.hook(name) if self.hook is not None else nullcontext()):
+                yield record
+        finally:
+            peak_bytes = None if trace is None else stop_trace(trace)
+        record["seconds"] = time.perf_counter() - start
+        record["peak_bytes"] = peak_bytes
+        self.records.append(record)
+
+    def extend(self, records):
+        # Adds records gathered elsewhere, e.g. by a worker process
+        self.records.extend(records)
+
+    def summary(self):
+        """
+        Totals per stage over all records (all files, all calls).
+
+        Returns:
+            A dict of stage name to {"calls", "seconds", "rows", "peak_bytes"}, where
+            peak_bytes is the largest peak of any single call
+        """
+
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record["stage"], {"calls": 0, "seconds": 0., "rows": 0,\
+                                                       "peak_bytes": None})
+            total["calls"] += 1
+            total["seconds"] += record["seconds"]
+            total["rows"] += record["rows"] or 0
+            if record["peak_bytes"] is not None:
+                total["peak_bytes"] = max(total["peak_bytes"] or 0, record["peak_bytes"])
+        return totals
+
+    def to_json(self, path = None):
+        # The records and their summary as JSON, written to 'path' if given
+        text = json.dumps({"records": self.records, "summary": self.summary()}, indent = 1)
+        if path is not None:
+            with open(path, "w") as f:
+                f.write(text)
+        return text
+
+    def to_csv(self, path):
+        # One row per record
+        with open(path, "w", newline = "") as f:
+            writer = csv.DictWriter(f, fieldnames = self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.records)
+
+    def __repr__(self):
+        return "\n".join("%-16s %4d calls %9.4f s %12d rows %s"\
+                         % (stage, t["calls"], t["seconds"], t["rows"],\
+                            "" if t["peak_bytes"] is None else "%.1f MB peak" % (t["peak_bytes"] / 1e6))\
+                         for stage, t in self.summary().items())
+
+
+def make_stats(stats):
+# StageStats to use for an analyzer: the one given, a new one if True, a disabled one if None / False
+    if isinstance(stats, StageStats):
+        return stats
+    return StageStats(enabled = bool(stats))
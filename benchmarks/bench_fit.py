@@ -0,0 +1,65 @@
+# Compares the per-window curve_fit loop that process_data used to run
+# with the closed-form batch_lin_fit, on synthetic cold periods.
+#
+#   python benchmarks/bench_fit.py [n_periods] [points_per_period]
+
+import os
+import sys
+import time
+import numpy as np
+from scipy.optimize import curve_fit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from SHT_Analyzer.fit_tools import lin_fit, get_chi_sq, batch_lin_fit
+from SHT_Analyzer.format_tools import fit_format
+
+
+def make_periods(n_periods, n_points, seed = 0):
+# 10 minute bins of slowly warming ~4K data, one period after the other
+    rng = np.random.default_rng(seed)
+    x_list, y_list = [], []
+    t0 = 0.
+    for _ in range(n_periods):
+        t = t0 + 600. * np.arange(n_points)
+        rate = rng.uniform(0.005, 0.05) / 86400
+        x_list.append(t)
+        y_list.append(3.8 + rate * (t - t0) + rng.normal(0, 0.01, n_points))
+        t0 = t[-1] + 86400.
+    return x_list, y_list
+
+def curve_fit_loop(x_list, y_list, uncert):
+    params, errs, chi_sq = [], [], []
+    for x, y in zip(x_list, y_list):
+        fitparams, fit_errs = fit_format(curve_fit(lin_fit, x, y))
+        params.append(fitparams)
+        errs.append(fit_errs)
+        chi_sq.append(get_chi_sq(y, lin_fit(x, *fitparams), uncert))
+    return np.array(params), np.array(errs), np.array(chi_sq)
+
+def best_of(func, repeat = 3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        retval = func()
+        times.append(time.perf_counter() - start)
+    return min(times), retval
+
+def main(n_periods = 200, n_points = 1000):
+    x_list, y_list = make_periods(n_periods, n_points)
+    uncert = 0.1
+
+    t_loop, (params, errs, chi_sq) = best_of(lambda: curve_fit_loop(x_list, y_list, uncert))
+    t_batch, (b_params, b_errs, _, b_chi_sq, _) = best_of(lambda: batch_lin_fit(x_list, y_list, uncert))
+
+    print("%d periods x %d points" % (n_periods, n_points))
+    print("curve_fit loop: %.4f s" % t_loop)
+    print("batch_lin_fit:  %.4f s  (%.0fx faster)" % (t_batch, t_loop / t_batch))
+    exact = np.array([np.polyfit(x, y, 1)[0] for x, y in zip(x_list, y_list)])
+    # Exact least squares slopes, for reference
+    print("max relative slope error vs np.polyfit: curve_fit %.1e, batch_lin_fit %.1e"\
+          % (np.max(np.abs(params[:, 0] / exact - 1)), np.max(np.abs(b_params[:, 0] / exact - 1))))
+    print("max relative difference to curve_fit: slope error %.1e, chi squared %.1e"\
+          % (np.max(np.abs(b_errs[:, 0] / errs[:, 0] - 1)), np.max(np.abs(b_chi_sq / chi_sq - 1))))
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,43 @@
+# Times linear_changepoints on its worst case, a single straight line with no
+# change to find (nothing can be pruned), and on the same data with a few changes
+# of slope, for cold periods of growing length.
+#
+#   python benchmarks/bench_segments.py [min_size] [n_points ...]
+
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from SHT_Analyzer.fit_tools import linear_changepoints
+
+
+def make_period(n_points, n_changes, seed = 0):
+# 10 minute bins of ~4K data warming at a rate that changes n_changes times
+    rng = np.random.default_rng(seed)
+    t = 600. * np.arange(n_points)
+    rates = rng.uniform(0.005, 0.05, n_changes + 1) / 86400
+    regime = np.searchsorted(np.linspace(0, n_points, n_changes + 2)[1:-1], np.arange(n_points), side = "right")
+    y = 3.8 + np.cumsum(rates[regime] * 600.) + rng.normal(0, 0.01, n_points)
+    return t, y
+
+def best_of(func, repeat = 3):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        retval = func()
+        times.append(time.perf_counter() - start)
+    return min(times), retval
+
+def main(min_size = 36, sizes = (3400, 13600, 52000)):
+    print("min_size %d (6 h of 10 minute bins)" % min_size)
+    for n_points in sizes:
+        for n_changes in (0, 4):
+            t, y = make_period(n_points, n_changes)
+            seconds, bounds = best_of(lambda: linear_changepoints(t, y, min_size = min_size))
+            print("%6d points, %d changes: %.3f s, %d segments found" % (n_points, n_changes, seconds, len(bounds) - 1))
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*args[:1], *[args[1:]] if len(args) > 1 else [])
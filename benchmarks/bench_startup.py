@@ -0,0 +1,67 @@
+# Times importing each entry module of the package in a fresh interpreter and
+# fails if any takes longer than the budget, or loads matplotlib, scipy or the
+# GUI toolkit before it is asked to plot.
+#
+#   python benchmarks/bench_startup.py [--budget 0.8] [--repeat 5]
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+MODULES = ["SHT_Analyzer.analyzer", "SHT_Analyzer.batch_tools", "SHT_Analyzer.prefetch_tools",\
+           "SHT_Analyzer.cli"]
+# What a script, the headless command and the GUI import before they can start
+
+HEAVY = ["matplotlib", "scipy", "PySimpleGUI", "tkinter"]
+# Only ever loaded on first use
+
+PROBE = """
+import sys, json, time
+start = time.perf_counter()
+import %s
+seconds = time.perf_counter() - start
+print(json.dumps([seconds, sorted(m for m in %r if m in sys.modules)]))
+"""
+
+
+def import_cost(module, repeat):
+# Shortest time to import 'module' in a fresh interpreter over 'repeat' runs, and the
+# heavy modules that came with it
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE % (module, HEAVY)], cwd = ROOT,\
+                             capture_output = True, text = True, check = True).stdout
+        seconds, loaded = json.loads(out)
+        times.append(seconds)
+    return min(times), loaded
+
+def main():
+    parser = argparse.ArgumentParser(description = "Check the import time of the package against a budget")
+    parser.add_argument("--budget", type = float, default = 0.8,\
+                        help = "most seconds any module may take to import")
+    parser.add_argument("--repeat", type = int, default = 5)
+    parser.add_argument("--output", help = "also write the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for module in MODULES:
+        seconds, loaded = import_cost(module, args.repeat)
+        ok = seconds <= args.budget and not loaded
+        results.append({"module": module, "seconds": seconds, "heavy_modules": loaded, "ok": ok})
+        print("%-32s %7.3f s  %s%s" % (module, seconds, "ok" if ok else "FAIL",\
+                                      "  (loads %s)" % ", ".join(loaded) if loaded else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"budget": args.budget, "python": sys.version, "results": results}, f, indent = 1)
+
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# Times each stage of the analysis on synthetic logs of several sizes and
+# writes the results as JSON, to compare between releases.
+#
+#   python benchmarks/run_benchmarks.py --days 30 365 --output bench.json
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+from SHT_Analyzer.format_tools import standardize_datetime
+from SHT_Analyzer.fit_tools import bin_by_minute, find_cold_ranges, slice_between, valid_mask, batch_lin_fit
+from SHT_Analyzer.data_tools import VALID_RANGES
+from SHT_Analyzer.graphing_tools import show_fits
+from synthetic_log import generate_log
+
+
+def best_of(func, repeat):
+# Shortest of 'repeat' runs of func, and its return value
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        retval = func()
+        times.append(time.perf_counter() - start)
+    return min(times), retval
+
+def despike(binned, col = "PtCo1(K)"):
+# The validity mask the analyzer computes when it loads a column
+    return valid_mask(binned[col].to_numpy(), VALID_RANGES[col])
+
+def select_windows(binned, cold_ranges, valid, col = "PtCo1(K)"):
+# The windows process_data would fit, without the points despike flagged
+    times = binned["date-time"].to_numpy().astype("datetime64[ns]").view(np.int64)
+    data = binned[col].to_numpy()
+    windows = []
+    for start_time, end_time in cold_ranges:
+        start_time = pd.Timestamp(start_time) + pd.Timedelta(hours = 1)
+        end_time = pd.Timestamp(end_time) - pd.Timedelta(minutes = 10)
+        window = slice_between(times, start_time, end_time)
+        index = window.start + np.flatnonzero(valid[window])
+        windows.append((start_time, end_time, index, data[index], (times[index] - times[0]) / 1e9))
+    return windows
+
+def draw_fits(binned, windows, fits):
+# Creates (and closes) the figure show_fits makes for each window
+    dt_data = binned["date-time"]
+    for (start_time, end_time, index, values, t_data), params in zip(windows, fits[0]):
+        show_fits(dt_data, index, values, "PtCo1(K)", True, t_data, params[0], params[1],\
+                  0., len(values), start_time, end_time, "Temperature [K]")
+        plt.gcf().canvas.draw()
+        plt.close("all")
+
+def bench_file(path, repeat):
+# Times every stage on one log; each stage gets the output of the previous one
+    stages = []
+    def run(name, func, rows):
+        seconds, retval = best_of(func, repeat)
+        stages.append({"stage": name, "seconds": seconds, "rows": rows})
+        return retval
+
+    raw = run("csv_ingest", lambda: pd.read_csv(path), None)
+    n_rows = len(raw)
+    stages[-1]["rows"] = n_rows
+    del raw
+
+    df = run("standardize_datetime", lambda: standardize_datetime(path), n_rows)
+    binned = run("bin_by_minute", lambda: bin_by_minute(df, n_minutes = 10), n_rows)
+    del df
+    cold_ranges = run("find_cold_ranges", lambda: find_cold_ranges(binned), len(binned))
+    valid = run("despike", lambda: despike(binned), len(binned))
+    windows = run("select_windows", lambda: select_windows(binned, cold_ranges, valid), len(binned))
+    fits = run("fit", lambda: batch_lin_fit([w[4] for w in windows], [w[3] for w in windows], 0.1),\
+               sum(len(w[3]) for w in windows))
+    run("show_fits", lambda: draw_fits(binned, windows, fits), sum(len(w[3]) for w in windows))
+
+    return n_rows, len(cold_ranges), stages
+
+def regressions(results, baseline, tolerance):
+# Stages that got slower than in a previous report by more than 'tolerance' (a fraction)
+    before = {(r["stage"], r["days"], r["step"]): r["seconds"] for r in baseline["results"]}
+    slower = []
+    for r in results:
+        old = before.get((r["stage"], r["days"], r["step"]))
+        if old and r["seconds"] > old * (1 + tolerance):
+            slower.append("%s at %g days: %.3fs -> %.3fs" % (r["stage"], r["days"], old, r["seconds"]))
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the SHT analysis stages")
+    parser.add_argument("--days", type = float, nargs = "+", default = [30., 180., 365.],\
+                        help = "lengths of the synthetic logs")
+    parser.add_argument("--step", type = float, default = 60., help = "sampling interval in s")
+    parser.add_argument("--cold", type = int, default = 0,\
+                        help = "cold periods per log (default: one per 30 days)")
+    parser.add_argument("--repeat", type = int, default = 3)
+    parser.add_argument("--data-dir", help = "where to keep the synthetic logs (default: temporary)")
+    parser.add_argument("--output", help = "JSON file to write (default: stdout)")
+    parser.add_argument("--baseline", help = "JSON report of a previous run to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.2,\
+                        help = "slowdown tolerated before a stage counts as a regression")
+    args = parser.parse_args()
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix = "sht_bench_")
+    os.makedirs(data_dir, exist_ok = True)
+
+    results = []
+    for days in args.days:
+        n_cold = args.cold or max(1, int(days // 30))
+        path = os.path.join(data_dir, "sht_%gd_%gs_%dcold.csv" % (days, args.step, n_cold))
+        if not os.path.exists(path):
+            generate_log(path, days = days, step = args.step, n_cold = n_cold)
+            # Logs are reused between runs when --data-dir is given
+
+        n_rows, n_ranges, stages = bench_file(path, args.repeat)
+        for stage in stages:
+            stage.update({"days": days, "step": args.step, "file_rows": n_rows,\
+                          "cold_ranges": n_ranges, "file_bytes": os.path.getsize(path)})
+        results += stages
+        print("%g days (%d rows): %s" % (days, n_rows, ", ".join("%s %.3fs" % (s["stage"], s["seconds"])\
+              for s in stages)), file = sys.stderr)
+
+    report = {"meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),\
+                       "numpy": np.__version__, "pandas": pd.__version__,\
+                       "matplotlib": matplotlib.__version__, "machine": platform.machine(),\
+                       "repeat": args.repeat},\
+              "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent = 1)
+    else:
+        json.dump(report, sys.stdout, indent = 1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for line in slower:
+            print("REGRESSION " + line, file = sys.stderr)
+        sys.exit(1 if slower else 0)
+
+if __name__ == "__main__":
+    main()
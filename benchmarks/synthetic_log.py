@@ -0,0 +1,131 @@
+# Writes synthetic SHT logger csvs with the same schema as the real logs,
+# for benchmarking the analysis on files of any size.
+#
+#   python benchmarks/synthetic_log.py out.csv --days 365 --step 60 --cold 4
+
+import argparse
+import numpy as np
+import pandas as pd
+
+
+LABELS = ["PtCo1(K)", "PtCo2(K)", "H2-Press(Torr)", "VAC-PM", "VAC-CC10 (Pa)"]
+# Columns of the SHT logger, as listed in Analyze_SHT.py
+
+WARM_K = 293.
+COLD_K = 3.9
+COOLDOWN_H = 6.
+# Room temperature, base temperature and cooldown / warmup time constant
+
+
+def default_cold_periods(days, n_cold):
+# Evenly spaced cold periods covering about 60% of the log, as (start, end) in days
+    period = days / max(n_cold, 1)
+    return [(i * period + 0.2 * period, i * period + 0.8 * period) for i in range(n_cold)]
+
+def temperature(t_days, cold_periods, warming_rates):
+# PtCo1 temperature in K: exponential cooldown into each cold period, linear warming
+# within it (rate in K/day) and exponential warmup back to room temperature after it
+    temps = np.full(len(t_days), WARM_K)
+    tau = COOLDOWN_H / 24.
+
+    for (start, end), rate in zip(cold_periods, warming_rates):
+        cold = (t_days >= start) & (t_days < end)
+        dt = t_days[cold] - start
+        temps[cold] = COLD_K + rate * dt + (WARM_K - COLD_K) * np.exp(-dt / tau)
+
+        after = t_days >= end
+        t_end = COLD_K + rate * (end - start)
+        dt = t_days[after] - end
+        temps[after] = np.minimum(temps[after], WARM_K - (WARM_K - t_end) * np.exp(-dt / tau))
+
+    return temps
+
+def generate_log(path, days = 30., step = 60., start = "2022/01/01 00:00:00", n_cold = 2,\
+                 cold_periods = None, warming_rates = None, spike_rate = 1e-4,\
+                 gaps = (), seed = 0, chunk_rows = 10**6):
+    """
+    Writes a synthetic SHT logger csv.
+
+    Rows are generated and written 'chunk_rows' at a time, so logs of any length can be
+    made with bounded memory.
+
+    Args:
+        path: Where to write the csv
+        days: Length of the log in days
+        step: Sampling interval in seconds
+        start: Timestamp of the first row, in the logger's format
+        n_cold: Number of evenly spaced cold periods, if cold_periods isn't given
+        cold_periods: List of (start, end) of each cold period, in days since the start
+        warming_rates: Warming rate of each cold period in K/day (random if None)
+        spike_rate: Fraction of rows where PtCo1 spikes far above 300 K
+        gaps: List of (start, length) in days where the logger wrote nothing
+        seed: Seed of the random number generator
+        chunk_rows: Rows generated at a time
+
+    Returns:
+        The number of rows written
+
+    """
+
+    rng = np.random.default_rng(seed)
+    if cold_periods is None:
+        cold_periods = default_cold_periods(days, n_cold)
+    if warming_rates is None:
+        warming_rates = rng.uniform(0.005, 0.04, len(cold_periods))
+
+    n_total = int(days * 86400 / step)
+    t0 = pd.Timestamp(start.replace("/", "-"))
+    n_written = 0
+
+    with open(path, "w") as f:
+        f.write(",".join(["date-time"] + LABELS) + "\n")
+
+        for first in range(0, n_total, chunk_rows):
+            t_days = np.arange(first, min(first + chunk_rows, n_total)) * step / 86400.
+            for gap_start, gap_length in gaps:
+                t_days = t_days[(t_days < gap_start) | (t_days >= gap_start + gap_length)]
+            n = len(t_days)
+
+            ptco1 = temperature(t_days, cold_periods, warming_rates)\
+                    + rng.normal(0, 0.005, n)
+            ptco2 = ptco1 + 0.4 + rng.normal(0, 0.005, n)
+            spikes = rng.random(n) < spike_rate
+            ptco1[spikes] = 10**rng.uniform(3, 6, spikes.sum())
+            # Random glitches of the readout, up to 1e6 K
+
+            cold_fraction = np.clip((WARM_K - ptco2) / (WARM_K - COLD_K), 0, 1)
+            h2_press = 5. + 700. * (1 - cold_fraction) + rng.normal(0, 0.5, n)
+            vac_pm = 10**(-3 - 3 * cold_fraction + rng.normal(0, 0.02, n))
+            vac_cc10 = 10**(-1 - 4 * cold_fraction + rng.normal(0, 0.02, n))
+
+            stamps = (t0 + pd.to_timedelta(np.round(t_days * 86400), unit = "s"))\
+                     .strftime("%Y/%m/%d %H:%M:%S")
+            pd.DataFrame({"date-time": stamps, "PtCo1(K)": ptco1, "PtCo2(K)": ptco2,\
+                          "H2-Press(Torr)": h2_press, "VAC-PM": vac_pm,\
+                          "VAC-CC10 (Pa)": vac_cc10})\
+              .to_csv(f, header = False, index = False, float_format = "%.6g")
+            n_written += n
+
+    return n_written
+
+def main():
+    parser = argparse.ArgumentParser(description = "Write a synthetic SHT logger csv")
+    parser.add_argument("path")
+    parser.add_argument("--days", type = float, default = 30.)
+    parser.add_argument("--step", type = float, default = 60., help = "sampling interval in s")
+    parser.add_argument("--start", default = "2022/01/01 00:00:00")
+    parser.add_argument("--cold", type = int, default = 2, help = "number of cold periods")
+    parser.add_argument("--rates", type = float, nargs = "*", help = "warming rates in K/day")
+    parser.add_argument("--spike-rate", type = float, default = 1e-4)
+    parser.add_argument("--gap", type = float, nargs = 2, action = "append", default = [],\
+                        metavar = ("START", "LENGTH"), help = "gap in the log, in days")
+    parser.add_argument("--seed", type = int, default = 0)
+    args = parser.parse_args()
+
+    n = generate_log(args.path, days = args.days, step = args.step, start = args.start,\
+                     n_cold = args.cold, warming_rates = args.rates, spike_rate = args.spike_rate,\
+                     gaps = args.gap, seed = args.seed)
+    print("Wrote %d rows to %s" % (n, args.path))
+
+if __name__ == "__main__":
+    main()
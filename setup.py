@@ -11,7 +11,17 @@ setup(
     packages=['SHT_Analyzer'],
     install_requires=[
                       'numpy',                     
+                      'pandas',
+                      'matplotlib',
                       ],
+    extras_require={
+                    'gui': ['PySimpleGUI'],
+                    'parquet': ['pyarrow'],
+                    },
+    entry_points={
+                  'console_scripts': ['sht-analyze=SHT_Analyzer.cli:main',
+                                      'sht-archive=SHT_Analyzer.archive_tools:main'],
+                  },
 
     classifiers=[
         'Development Status :: 1 - Planning',